@@ -0,0 +1,201 @@
+"""
+FleetFlow - Audit Log
+Records who changed what, without adding a database round trip to mutations.
+
+Endpoints call ``record`` with before/after row images; fields in
+``REDACTED_FIELDS`` are dropped from them first, since the log is permanent
+and readable through the API. Entries go onto a bounded in-process queue; a
+background thread drains it and writes batches to the partitioned,
+append-only ``audit_log`` table every
+``FLUSH_INTERVAL_SECONDS`` or as soon as ``FLUSH_BATCH_SIZE`` entries are
+waiting. If a write fails, the flusher keeps the batch and retries it with
+exponential backoff (capped at ``RETRY_MAX_SECONDS``) while new entries queue
+behind it. If the queue is full, the caller writes its entry synchronously
+instead of dropping it. Entries still buffered when the process is killed
+outright (not shut down) are lost; a clean shutdown flushes them.
+"""
+import json
+import queue
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+import psycopg2.extras
+
+import database
+
+QUEUE_SIZE = 10000
+FLUSH_BATCH_SIZE = 500
+FLUSH_INTERVAL_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60
+PAGE_SIZE_MAX = 200
+REDACTED_FIELDS = {"password_hash"}
+
+_INSERT_SQL = """INSERT INTO audit_log (created_at, actor, action, entity, entity_id, before, after)
+                 VALUES %s"""
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _redact(image):
+    if image is None:
+        return None
+    return {k: v for k, v in image.items() if k not in REDACTED_FIELDS}
+
+
+def _jsonb(image):
+    if image is None:
+        return None
+    return psycopg2.extras.Json(image, dumps=lambda v: json.dumps(v, default=_json_default))
+
+
+def _month_start(ts: datetime):
+    return date(ts.year, ts.month, 1)
+
+
+class AuditLog:
+    """Bounded buffer plus a background flusher for audit entries."""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._partitions = set()   # month starts known to have a partition
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._retry = []            # batch whose write failed, written before anything newer
+
+    def record(self, action: str, entity: str, entity_id=None, before=None, after=None, actor: str = ""):
+        """Queue one audit entry. Only blocks if the buffer is full."""
+        entry = (datetime.utcnow(), actor or "", action, entity,
+                 None if entity_id is None else str(entity_id), _redact(before), _redact(after))
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._write([entry])
+
+    def _ensure_partitions(self, cursor, entries):
+        for month in {_month_start(e[0]) for e in entries} - self._partitions:
+            next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS audit_log_{month:%Y_%m} PARTITION OF audit_log
+                    FOR VALUES FROM ('{month}') TO ('{next_month}')"""
+            )
+            self._partitions.add(month)
+
+    def _write(self, entries):
+        rows = [(ts, actor, action, entity, entity_id, _jsonb(before), _jsonb(after))
+                for ts, actor, action, entity, entity_id, before, after in entries]
+        with self._write_lock:
+            conn = database.get_connection()
+            try:
+                for attempt in (1, 2):
+                    try:
+                        cursor = conn.cursor()
+                        self._ensure_partitions(cursor, entries)
+                        psycopg2.extras.execute_values(cursor, _INSERT_SQL, rows, page_size=len(rows))
+                        conn.commit()
+                        return
+                    except psycopg2.Error:
+                        # Usually another worker creating the same partition; retry once
+                        conn.rollback()
+                        self._partitions.clear()
+                        if attempt == 2:
+                            raise
+            finally:
+                conn.close()
+
+    def flush(self):
+        """Write everything currently buffered. Returns the number of entries written."""
+        written = 0
+        if self._retry:
+            self._write(self._retry)
+            written, self._retry = len(self._retry), []
+        while True:
+            batch = []
+            while len(batch) < FLUSH_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return written
+            self._write(batch)
+            written += len(batch)
+
+    def _run(self):
+        delay = 0.0
+        while not self._stop.is_set():
+            try:
+                if self._retry:
+                    batch = self._retry
+                else:
+                    # Block until an entry arrives, then take whatever follows closely, up to a batch
+                    batch = [self._queue.get(timeout=FLUSH_INTERVAL_SECONDS)]
+                    while len(batch) < FLUSH_BATCH_SIZE:
+                        try:
+                            batch.append(self._queue.get(timeout=FLUSH_INTERVAL_SECONDS / 10))
+                        except queue.Empty:
+                            break
+                self._write(batch)
+                self._retry, delay = [], 0.0
+            except queue.Empty:
+                continue
+            except Exception as exc:
+                # Keep the batch; stop() flushes it if the process shuts down first
+                self._retry = batch
+                delay = min(RETRY_MAX_SECONDS, max(FLUSH_INTERVAL_SECONDS, delay * 2))
+                print(f"Audit log: flush of {len(batch)} entries failed, retrying in {delay:.1f}s: {exc}")
+                self._stop.wait(delay)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=FLUSH_INTERVAL_SECONDS + 5)
+        self.flush()
+
+
+def query(entity: str = None, entity_id=None, actor: str = None, cursor_id: int = None, limit: int = 50):
+    """Return a page of audit entries, newest first, with a cursor for the next page."""
+    clauses, params = [], []
+    if entity:
+        clauses.append("entity = %s")
+        params.append(entity)
+    if entity_id is not None:
+        clauses.append("entity_id = %s")
+        params.append(str(entity_id))
+    if actor:
+        clauses.append("actor = %s")
+        params.append(actor)
+    if cursor_id is not None:
+        clauses.append("id < %s")
+        params.append(cursor_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+
+    conn = database.get_read_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(
+        f"""SELECT id, created_at, actor, action, entity, entity_id, before, after
+            FROM audit_log {where} ORDER BY id DESC LIMIT %s""",
+        params + [limit],
+    )
+    entries = cursor.fetchall()
+    conn.close()
+    next_cursor = entries[-1]["id"] if len(entries) == limit else None
+    return {"entries": entries, "next_cursor": next_cursor}
+
+
+log = AuditLog()
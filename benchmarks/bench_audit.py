@@ -0,0 +1,49 @@
+"""
+Latency that audit logging adds to a request.
+
+Measures ``audit.log.record`` alone: the call only enqueues, so this is the
+overhead every mutating endpoint pays. The flusher is not started and no
+database is touched; the queue is drained between rounds so it never fills.
+
+    python benchmarks/bench_audit.py --calls 200000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audit  # noqa: E402
+
+ROW = {"id": 1, "name": "Jane Driver", "email": "jane@fleetflow.test", "role": "Dispatcher"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    log = audit.AuditLog()
+    samples = []
+    round_size = audit.QUEUE_SIZE // 2
+    for start in range(0, args.calls, round_size):
+        for i in range(start, min(start + round_size, args.calls)):
+            t0 = time.perf_counter_ns()
+            log.record("update_role", "user", i, ROW, ROW, "bench@fleetflow.test")
+            samples.append(time.perf_counter_ns() - t0)
+        while not log._queue.empty():
+            log._queue.get_nowait()
+
+    samples.sort()
+    pct = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))] / 1000
+    print(f"calls:   {len(samples)}")
+    print(f"mean:    {statistics.fmean(samples) / 1000:.2f} us")
+    print(f"p50:     {pct(0.50):.2f} us")
+    print(f"p99:     {pct(0.99):.2f} us")
+    print(f"max:     {samples[-1] / 1000:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
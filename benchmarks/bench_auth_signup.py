@@ -0,0 +1,85 @@
+"""
+Multi-process sign-up throughput for the auth service SQLite store.
+
+Each worker process inserts users through storage.create_user against a
+fresh database file and counts "database is locked" errors. Every worker
+also races for the same username once, which must succeed exactly once.
+bcrypt is left out (a fixed hash is stored) so the numbers reflect storage.
+
+    python benchmarks/bench_auth_signup.py --processes 8 --signups 2000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+AUTH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "user_authentication")
+FAKE_HASH = "$2b$12$" + "x" * 53
+
+
+def _worker(index, signups, start_barrier, results):
+    sys.path.insert(0, AUTH_DIR)
+    from sqlalchemy.exc import OperationalError
+    import storage
+
+    start_barrier.wait()
+    inserted = locked = 0
+    try:
+        for n in range(signups):
+            try:
+                if storage.create_user(f"user_{index}_{n}", f"user_{index}_{n}@bench.test", FAKE_HASH, "User"):
+                    inserted += 1
+            except OperationalError as exc:
+                if "locked" not in str(exc):
+                    raise
+                locked += 1
+        raced = storage.create_user("contested", "contested@bench.test", FAKE_HASH, "User")
+        results.put((inserted, locked, raced))
+    except Exception as exc:
+        results.put(exc)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--signups", type=int, default=2000, help="sign-ups per process")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="fleetflow-auth-bench-")
+    os.environ["AUTH_DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'users.db')}"
+    sys.path.insert(0, AUTH_DIR)
+    from db import metadata, engine
+    import models  # noqa: F401  (registers the users table on metadata)
+    metadata.create_all(engine)
+    engine.dispose()
+
+    barrier = multiprocessing.Barrier(args.processes + 1)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_worker, args=(i, args.signups, barrier, results))
+             for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    barrier.wait()
+    start = time.perf_counter()
+    outcomes = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - start
+    for p in procs:
+        p.join()
+    errors = [o for o in outcomes if isinstance(o, Exception)]
+    if errors:
+        raise SystemExit(f"{len(errors)} worker(s) failed: {errors[0]}")
+
+    inserted = sum(o[0] for o in outcomes)
+    locked = sum(o[1] for o in outcomes)
+    raced = sum(1 for o in outcomes if o[2])
+    print(f"processes:        {args.processes}")
+    print(f"signups:          {inserted} in {elapsed:.2f}s ({inserted / elapsed:,.0f}/s)")
+    print(f"lock errors:      {locked}")
+    print(f"contested wins:   {raced} (expected 1)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Auth service sign-in under a simulated credential-stuffing attack.
+
+Attacker threads cycle through a pool of source IPs and real account emails
+with wrong passwords (so every request reaches bcrypt), while legitimate
+users sign in once each with the correct password from their own IP. The
+same load runs twice, with the throttle and verification cap off and then
+on, calling the /SignIn endpoint function directly on a temporary database.
+
+    python benchmarks/bench_login_throttle.py --attackers 32 --seconds 10
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+AUTH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "user_authentication")
+LEGIT_PASSWORD = "correct horse battery staple"
+
+
+def _request(ip):
+    from starlette.requests import Request
+    return Request({"type": "http", "method": "POST", "path": "/SignIn", "headers": [], "client": (ip, 0)})
+
+
+def _signin(app, schemas, email, password, ip):
+    from fastapi import HTTPException
+    try:
+        app.user_signin(schemas.UserLogin(email=email, password=password), _request(ip))
+        return 200
+    except HTTPException as exc:
+        return exc.status_code
+
+
+def run(app, schemas, ratelimit, args, protected):
+    app.signin_throttle.backend = ratelimit.MemoryBackend()
+    app.signin_throttle.enabled = protected
+    app.verify_gate = ratelimit.AdmissionGate(app.VERIFY_CONCURRENCY if protected else 10 ** 6)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    attack = {}
+    legit_status, legit_latency = {}, []
+
+    def attacker(index):
+        rng = random.Random(index)
+        interval = args.attackers / args.attack_rate
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            # Paced to the offered attack rate; a thread that falls behind sends immediately
+            next_at += interval
+            stop.wait(max(0.0, next_at - time.perf_counter()))
+            n = rng.randrange(args.attack_ips)
+            ip = f"10.66.{n // 256}.{n % 256}"
+            email = f"victim_{rng.randrange(args.victims)}@bench.test"
+            status = _signin(app, schemas, email, "hunter2", ip)
+            with lock:
+                attack[status] = attack.get(status, 0) + 1
+
+    def legit(index):
+        for n in range(index, args.legit_users, args.legit):
+            if stop.is_set():
+                break
+            start = time.perf_counter()
+            status = _signin(app, schemas, f"legit_{n}@bench.test", LEGIT_PASSWORD,
+                             f"192.168.{n // 256}.{n % 256}")
+            elapsed = time.perf_counter() - start
+            with lock:
+                legit_status[status] = legit_status.get(status, 0) + 1
+                legit_latency.append(elapsed)
+            stop.wait(args.legit_interval)
+
+    threads = [threading.Thread(target=attacker, args=(i,)) for i in range(args.attackers)]
+    threads += [threading.Thread(target=legit, args=(i,)) for i in range(args.legit)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    legit_latency.sort()
+    legit_total = sum(legit_status.values())
+    print(f"--- throttle {'on' if protected else 'off'} ---")
+    print(f"attack requests:   {sum(attack.values())} ({dict(sorted(attack.items()))})")
+    print(f"bcrypt verifies:   {attack.get(404, 0) + legit_status.get(200, 0)} "
+          f"({(attack.get(404, 0) + legit_status.get(200, 0)) / args.seconds:,.0f}/s)")
+    print(f"legit sign-ins:    {legit_status.get(200, 0)}/{legit_total} ok ({dict(sorted(legit_status.items()))})")
+    if legit_latency:
+        p99 = legit_latency[min(len(legit_latency) - 1, int(len(legit_latency) * 0.99))]
+        print(f"legit latency:     p50 {statistics.median(legit_latency) * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attackers", type=int, default=32, help="attacker threads")
+    parser.add_argument("--attack-rate", type=float, default=500, help="attack requests per second offered")
+    parser.add_argument("--attack-ips", type=int, default=200, help="distinct attacker source IPs")
+    parser.add_argument("--victims", type=int, default=500, help="accounts being targeted")
+    parser.add_argument("--legit", type=int, default=4, help="legitimate user threads")
+    parser.add_argument("--legit-users", type=int, default=1000, help="legitimate accounts (one sign-in each)")
+    parser.add_argument("--legit-interval", type=float, default=0.5, help="seconds between legit sign-ins")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=8, help="bcrypt cost of the stored hashes")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="fleetflow-login-bench-")
+    os.environ["AUTH_DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'users.db')}"
+    os.environ.pop("RATE_LIMIT_BACKEND_URL", None)
+    sys.path.insert(0, AUTH_DIR)
+    import app
+    import ratelimit
+    import schemas
+    import storage
+    from passlib.hash import bcrypt
+
+    # Every account shares one hash per password; only the cost matters here
+    victim_hash = bcrypt.using(rounds=args.rounds).hash("not-the-password")
+    legit_hash = bcrypt.using(rounds=args.rounds).hash(LEGIT_PASSWORD)
+    for i in range(args.victims):
+        storage.create_user(f"victim_{i}", f"victim_{i}@bench.test", victim_hash, "User")
+    for i in range(args.legit_users):
+        storage.create_user(f"legit_{i}", f"legit_{i}@bench.test", legit_hash, "Manager")
+
+    print(f"attack: {args.attack_rate:,.0f} req/s from {args.attackers} threads over {args.attack_ips} IPs, {args.victims} accounts; "
+          f"legit: {args.legit} threads; bcrypt rounds {args.rounds}; "
+          f"verify cap {app.VERIFY_CONCURRENCY}; {args.seconds:.0f}s per run")
+    run(app, schemas, ratelimit, args, protected=False)
+    run(app, schemas, ratelimit, args, protected=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark the maintenance scheduler heap at fleet scale (no database needed).
+
+    python benchmarks/bench_maintenance_scheduler.py --vehicles 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from maintenance_scheduler import MaintenanceScheduler, RATE_WINDOW_DAYS  # noqa: E402
+
+
+def make_row(rng, vehicle_id, today):
+    return {
+        "vehicle_id": vehicle_id,
+        "vehicle_type": rng.choice(("Truck", "Van", "Bike")),
+        "last_service": today - timedelta(days=rng.randint(0, 200)),
+        "km_since_service": rng.uniform(0, 30000),
+        "km_recent": rng.uniform(0, 300) * RATE_WINDOW_DAYS,
+    }
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed * 1000:10.1f} ms")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=100_000)
+    parser.add_argument("--updates", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    today = date.today()
+    rows = [make_row(rng, i, today) for i in range(1, args.vehicles + 1)]
+    sched = MaintenanceScheduler()
+
+    timed(f"initial load ({args.vehicles} vehicles)", lambda: sched.apply_stats(rows, today))
+
+    updates = [make_row(rng, rng.randint(1, args.vehicles), today) for _ in range(args.updates)]
+    _, elapsed = timed(f"incremental updates ({args.updates})",
+                       lambda: sched.apply_stats(updates, today))
+    print(f"{'  per trip completion':<40} {elapsed / args.updates * 1e6:10.2f} us")
+
+    timed("upcoming(20)", lambda: sched.upcoming(20))
+    due, _ = timed("pop due today", lambda: sched.pop_due(today))
+    print(f"{'  vehicles due':<40} {len(due):10d}")
+    print(f"{'  heap entries left (incl. stale)':<40} {len(sched._heap):10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Measure type-ahead latency of database.search against DATABASE_URL.
+
+Seed the database at scale first (100k+ rows), then:
+
+    python benchmarks/bench_search.py --queries 500
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Mix of 2-6 character prefixes, the way a user types into the search box;
+    # 4+ characters also take the fuzzy path. Half start from a real make/name.
+    alphabet = string.ascii_lowercase + string.digits
+    words = ["volvo", "kenworth", "freightliner", "sprinter", "garcia", "nguyen", "transit", "maria"]
+    terms = []
+    for _ in range(args.queries):
+        n = rng.randint(2, 6)
+        if rng.random() < 0.5:
+            terms.append(rng.choice(words)[:n])
+        else:
+            terms.append("".join(rng.choice(alphabet) for _ in range(n)))
+
+    database.search("warmup", limit=args.limit)
+    timings = []
+    for term in terms:
+        start = time.perf_counter()
+        database.search(term, limit=args.limit)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    print(f"queries: {len(timings)}")
+    print(f"p50:  {statistics.median(timings):7.2f} ms")
+    print(f"p95:  {timings[int(len(timings) * 0.95) - 1]:7.2f} ms")
+    print(f"p99:  {timings[int(len(timings) * 0.99) - 1]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,19 +4,159 @@ Handles all database operations for user management.
 """
 import psycopg2
 import psycopg2.extras
+import contextvars
+import itertools
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
+# Optional comma-separated read replicas. Point it at DATABASE_URL itself to
+# exercise the routing locally with a single instance.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_CONNECT_TIMEOUT = 2
+# How long a replica that failed to connect is skipped before being retried
+REPLICA_RETRY_SECONDS = 30
+# A replica further behind the primary than this leaves the rotation until it
+# catches up; lag is measured at most once per REPLICA_LAG_CHECK_SECONDS.
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = 2
+# After a write, a client's reads go to the primary for this long. Longer than
+# the lag a replica may have and still serve reads, so a reload sees the write.
+READ_YOUR_WRITES_SECONDS = 2 * REPLICA_MAX_LAG_SECONDS + REPLICA_LAG_CHECK_SECONDS
 
-def get_connection():
+# Set per request (see main.py) to send every read of that request to the primary
+read_from_primary = contextvars.ContextVar("read_from_primary", default=False)
+
+# Searchable document per entity. These exact expressions back the tsvector
+# and trigram indexes in init_db, so search() must use them verbatim for the
+# planner to pick the indexes up.
+SEARCH_DOCUMENTS = {
+    "vehicles": "(vehicle_id || ' ' || license_plate || ' ' || vin || ' ' || make || ' ' || model)",
+    "drivers": "(name || ' ' || license_number)",
+    "users": "(name || ' ' || email)",
+}
+# The words people misspell. Identifiers, plates and VINs are only prefix
+# matched: their random trigrams make typo matching slow and noisy.
+SEARCH_FUZZY_DOCUMENTS = {
+    "vehicles": "(make || ' ' || model)",
+    "drivers": "(name)",
+    "users": "(name)",
+}
+
+def get_connection(connect=psycopg2.connect):
     """Get a database connection from the DATABASE_URL."""
     if not DATABASE_URL:
         # Prevent silent failures, fail fast if the URI isn't provided
         raise ValueError("DATABASE_URL environment variable is not set. Please set it to an online PostgreSQL database URI.")
-    return psycopg2.connect(DATABASE_URL)
+    return connect(DATABASE_URL)
+
+
+_replica_rr = itertools.count()
+_replica_down_until = {}
+_replica_lag = {}   # url -> (seconds behind, monotonic time measured)
+
+# Seconds since the last replayed transaction, or 0 when the replica is
+# streaming and has replayed everything received (an idle primary sends nothing
+# new to replay). A replica whose WAL receiver is not streaming cannot tell
+# what it is missing, so it gets the time since its last replay, which only
+# grows; one that has replayed nothing yet is infinitely behind.
+_REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity')
+    END
+"""
+
+
+def _replica_lagging(url: str, conn) -> bool:
+    """Measure replay lag on ``conn`` if due; True if the replica is too far behind."""
+    lag, measured = _replica_lag.get(url, (0.0, float("-inf")))
+    if time.monotonic() - measured >= REPLICA_LAG_CHECK_SECONDS:
+        cursor = conn.cursor()
+        cursor.execute(_REPLICA_LAG_SQL)
+        lag = float(cursor.fetchone()[0])
+        conn.rollback()
+        _replica_lag[url] = (lag, time.monotonic())
+        if lag > REPLICA_MAX_LAG_SECONDS:
+            _replica_down_until[url] = time.monotonic() + REPLICA_LAG_CHECK_SECONDS
+            print(f"Read replica {lag:.1f}s behind, skipping for {REPLICA_LAG_CHECK_SECONDS}s")
+    return lag > REPLICA_MAX_LAG_SECONDS
+
+
+def get_read_connection(connect=psycopg2.connect):
+    """Get a connection for read-only work.
+
+    Rotates round-robin over DATABASE_REPLICA_URLS, skipping replicas that
+    recently failed to connect or are more than REPLICA_MAX_LAG_SECONDS
+    behind, and falls back to the primary when none are configured or usable,
+    or when ``read_from_primary`` is set for this request. ``connect`` opens
+    the chosen URL.
+    """
+    if DATABASE_REPLICA_URLS and not read_from_primary.get():
+        start = next(_replica_rr)
+        for i in range(len(DATABASE_REPLICA_URLS)):
+            url = DATABASE_REPLICA_URLS[(start + i) % len(DATABASE_REPLICA_URLS)]
+            if _replica_down_until.get(url, 0) > time.monotonic():
+                continue
+            try:
+                conn = connect(url, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+            except psycopg2.OperationalError as exc:
+                _replica_down_until[url] = time.monotonic() + REPLICA_RETRY_SECONDS
+                print(f"Read replica unavailable, skipping for {REPLICA_RETRY_SECONDS}s: {exc}")
+                continue
+            try:
+                lagging = _replica_lagging(url, conn)
+            except psycopg2.Error as exc:
+                conn.close()
+                _replica_down_until[url] = time.monotonic() + REPLICA_RETRY_SECONDS
+                print(f"Read replica lag check failed, skipping for {REPLICA_RETRY_SECONDS}s: {exc}")
+                continue
+            if lagging:
+                conn.close()
+                continue
+            return conn
+    return get_connection(connect)
+
+
+def replica_status():
+    """Return each configured replica with whether it is in rotation and its last measured lag.
+
+    ``lag_seconds`` is None until measured, and for a replica that has not
+    replayed anything since it lost its WAL stream.
+    """
+    now = time.monotonic()
+    return [
+        {
+            "index": i,
+            "healthy": _replica_down_until.get(url, 0) <= now,
+            "lag_seconds": _replica_lag[url][0] if url in _replica_lag and _replica_lag[url][0] != float("inf") else None,
+        }
+        for i, url in enumerate(DATABASE_REPLICA_URLS)
+    ]
+
+
+def _connect(primary: bool, connect=psycopg2.connect):
+    return get_connection(connect) if primary else get_read_connection(connect)
+
+
+# search() runs on every keystroke, and a new backend (connect plus cold
+# catalog caches) costs more than the query itself. Each thread keeps its
+# search connection to each database open instead; a closed one is reopened.
+_search_connections = threading.local()
+
+
+def _search_connect(url, **kwargs):
+    conns = _search_connections.__dict__.setdefault("by_url", {})
+    if url not in conns or conns[url].closed:
+        conns[url] = psycopg2.connect(url, **kwargs)
+    return conns[url]
 
 
 def init_db():
@@ -29,6 +169,8 @@ def init_db():
     conn.autocommit = True
     cursor = conn.cursor()
 
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
     # Enums (We must use DO $$ blocks because CREATE TYPE IF NOT EXISTS doesn't exist)
     cursor.execute("""
     DO $$ BEGIN
@@ -47,6 +189,9 @@ def init_db():
         IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'vehicle_type_enum') THEN
             CREATE TYPE vehicle_type_enum AS ENUM ('Truck', 'Van', 'Bike');
         END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'job_status') THEN
+            CREATE TYPE job_status AS ENUM ('queued', 'running', 'succeeded', 'failed');
+        END IF;
     END $$;
     """)
 
@@ -97,6 +242,25 @@ def init_db():
         );
     """)
 
+    # Origin-destination lanes (see lanes.py); keys are the normalised place names
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION lane_key(place TEXT) RETURNS TEXT AS $$
+            SELECT lower(regexp_replace(btrim(place), '\\s+', ' ', 'g'))
+        $$ LANGUAGE sql IMMUTABLE;
+
+        CREATE TABLE IF NOT EXISTS lanes (
+            id SERIAL PRIMARY KEY,
+            origin VARCHAR(150) NOT NULL,
+            destination VARCHAR(150) NOT NULL,
+            origin_key TEXT NOT NULL,
+            destination_key TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (origin_key, destination_key)
+        );
+    """)
+
+    cursor.execute("SELECT to_regclass('trips') IS NOT NULL")
+    trips_existed = cursor.fetchone()[0]
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS trips (
             id SERIAL PRIMARY KEY,
@@ -109,9 +273,18 @@ def init_db():
             start_odometer NUMERIC(12,2),
             end_odometer NUMERIC(12,2),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            completed_at TIMESTAMP
+            completed_at TIMESTAMP,
+            lane_id INTEGER REFERENCES lanes(id)
         );
     """)
+    # Trips tables from before lanes existed get the column here and are backfilled below
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'trips' AND column_name = 'lane_id'
+    """)
+    needs_lane_backfill = trips_existed and cursor.fetchone() is None
+    if needs_lane_backfill:
+        cursor.execute("ALTER TABLE trips ADD COLUMN lane_id INTEGER REFERENCES lanes(id)")
 
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS maintenance_logs (
@@ -142,6 +315,220 @@ def init_db():
         );
     """)
 
+    # Background job queue (see jobs.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload JSONB NOT NULL DEFAULT '{}',
+            status job_status NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5 CHECK (max_attempts > 0),
+            progress NUMERIC(5,2) NOT NULL DEFAULT 0,
+            progress_message TEXT NOT NULL DEFAULT '',
+            result JSONB,
+            last_error TEXT,
+            locked_by TEXT,
+            run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            heartbeat_at TIMESTAMP
+        );
+    """)
+
+    # Telemetry time-series (see telemetry.py). No foreign keys: ingest filters
+    # unknown vehicles itself, and per-row FK checks would slow appends.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS telemetry_readings (
+            vehicle_id INTEGER NOT NULL,
+            recorded_at TIMESTAMP NOT NULL,
+            odometer NUMERIC(12,2) CHECK (odometer >= 0),
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            fuel_level NUMERIC(5,2) CHECK (fuel_level BETWEEN 0 AND 100),
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITH (fillfactor = 100);
+    """)
+    for rollup in ("telemetry_1m", "telemetry_1h", "telemetry_1d"):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {rollup} (
+                vehicle_id INTEGER NOT NULL,
+                bucket TIMESTAMP NOT NULL,
+                samples INTEGER NOT NULL,
+                odometer_min NUMERIC(12,2),
+                odometer_max NUMERIC(12,2),
+                fuel_level_sum NUMERIC(14,2) NOT NULL DEFAULT 0,
+                fuel_level_count INTEGER NOT NULL DEFAULT 0,
+                last_at TIMESTAMP NOT NULL,
+                last_latitude DOUBLE PRECISION,
+                last_longitude DOUBLE PRECISION,
+                last_fuel_level NUMERIC(5,2),
+                PRIMARY KEY (vehicle_id, bucket)
+            );
+        """)
+
+    # Per-lane daily aggregates by trip creation day, recomputed for the
+    # (lane, day) pairs that triggers below mark dirty (see lanes.refresh)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lane_daily_stats (
+            day DATE NOT NULL,
+            lane_id INTEGER NOT NULL REFERENCES lanes(id) ON DELETE CASCADE,
+            trips INTEGER NOT NULL,
+            cargo_weight_sum NUMERIC(16,2) NOT NULL,
+            revenue NUMERIC(16,2) NOT NULL,
+            completed_trips INTEGER NOT NULL,
+            turnaround_seconds_sum DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (day, lane_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS lane_stats_dirty (
+            lane_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            PRIMARY KEY (lane_id, day)
+        );
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION trips_assign_lane() RETURNS trigger AS $$
+        DECLARE
+            o TEXT := lane_key(NEW.origin);
+            d TEXT := lane_key(NEW.destination);
+        BEGIN
+            SELECT id INTO NEW.lane_id FROM lanes WHERE origin_key = o AND destination_key = d;
+            IF NOT FOUND THEN
+                INSERT INTO lanes (origin, destination, origin_key, destination_key)
+                VALUES (btrim(NEW.origin), btrim(NEW.destination), o, d)
+                ON CONFLICT (origin_key, destination_key) DO UPDATE SET origin_key = EXCLUDED.origin_key
+                RETURNING id INTO NEW.lane_id;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Statement-level, so a COPY or bulk UPDATE marks each (lane, day) once.
+        -- A key that is already dirty is still updated, not skipped: the row lock
+        -- is held until this transaction commits, so lanes.refresh (which claims
+        -- keys with SKIP LOCKED) cannot claim it and recompute the day without
+        -- seeing this write. Keys are inserted in sorted order so concurrent bulk
+        -- writers take those locks in the same order and cannot deadlock
+        CREATE OR REPLACE FUNCTION trips_mark_lane_days() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO lane_stats_dirty (lane_id, day)
+                SELECT DISTINCT lane_id, created_at::date FROM old_rows
+                WHERE lane_id IS NOT NULL AND created_at IS NOT NULL
+                ORDER BY 1, 2
+                ON CONFLICT (lane_id, day) DO UPDATE SET day = EXCLUDED.day;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO lane_stats_dirty (lane_id, day)
+                SELECT DISTINCT lane_id, created_at::date FROM new_rows
+                WHERE lane_id IS NOT NULL AND created_at IS NOT NULL
+                ORDER BY 1, 2
+                ON CONFLICT (lane_id, day) DO UPDATE SET day = EXCLUDED.day;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Revenue deleted by a trip's cascade finds no trip here; the trip's own delete marks it
+        CREATE OR REPLACE FUNCTION trip_revenue_mark_lane_days() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO lane_stats_dirty (lane_id, day)
+                SELECT DISTINCT t.lane_id, t.created_at::date
+                FROM trips t WHERE t.id IN (SELECT trip_id FROM old_rows)
+                    AND t.lane_id IS NOT NULL AND t.created_at IS NOT NULL
+                ORDER BY 1, 2
+                ON CONFLICT (lane_id, day) DO UPDATE SET day = EXCLUDED.day;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO lane_stats_dirty (lane_id, day)
+                SELECT DISTINCT t.lane_id, t.created_at::date
+                FROM trips t WHERE t.id IN (SELECT trip_id FROM new_rows)
+                    AND t.lane_id IS NOT NULL AND t.created_at IS NOT NULL
+                ORDER BY 1, 2
+                ON CONFLICT (lane_id, day) DO UPDATE SET day = EXCLUDED.day;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trips_lane_on_insert') THEN
+                CREATE TRIGGER trips_lane_on_insert BEFORE INSERT ON trips
+                    FOR EACH ROW WHEN (NEW.lane_id IS NULL) EXECUTE FUNCTION trips_assign_lane();
+                CREATE TRIGGER trips_lane_on_update BEFORE UPDATE OF origin, destination ON trips
+                    FOR EACH ROW WHEN (OLD.origin IS DISTINCT FROM NEW.origin
+                                       OR OLD.destination IS DISTINCT FROM NEW.destination)
+                    EXECUTE FUNCTION trips_assign_lane();
+                CREATE TRIGGER trips_lane_days_ins AFTER INSERT ON trips
+                    REFERENCING NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION trips_mark_lane_days();
+                CREATE TRIGGER trips_lane_days_upd AFTER UPDATE ON trips
+                    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION trips_mark_lane_days();
+                CREATE TRIGGER trips_lane_days_del AFTER DELETE ON trips
+                    REFERENCING OLD TABLE AS old_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION trips_mark_lane_days();
+                CREATE TRIGGER trip_revenue_lane_days_ins AFTER INSERT ON trip_revenue
+                    REFERENCING NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION trip_revenue_mark_lane_days();
+                CREATE TRIGGER trip_revenue_lane_days_upd AFTER UPDATE ON trip_revenue
+                    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION trip_revenue_mark_lane_days();
+                CREATE TRIGGER trip_revenue_lane_days_del AFTER DELETE ON trip_revenue
+                    REFERENCING OLD TABLE AS old_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION trip_revenue_mark_lane_days();
+            END IF;
+        END $$;
+    """)
+    if needs_lane_backfill:
+        # One pass over existing trips; the UPDATE trigger marks every (lane, day) dirty
+        cursor.execute("""
+            INSERT INTO lanes (origin, destination, origin_key, destination_key)
+            SELECT DISTINCT ON (lane_key(origin), lane_key(destination))
+                   btrim(origin), btrim(destination), lane_key(origin), lane_key(destination)
+            FROM trips
+            ORDER BY lane_key(origin), lane_key(destination), id
+            ON CONFLICT DO NOTHING;
+
+            UPDATE trips t SET lane_id = l.id
+            FROM lanes l
+            WHERE t.lane_id IS NULL
+              AND l.origin_key = lane_key(t.origin) AND l.destination_key = lane_key(t.destination);
+        """)
+
+    # Append-only audit trail (see audit.py). Monthly partitions are created
+    # on demand by the flusher; old months can be detached or dropped whole.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id BIGSERIAL,
+            created_at TIMESTAMP NOT NULL,
+            actor TEXT NOT NULL DEFAULT '',
+            action TEXT NOT NULL,
+            entity TEXT NOT NULL,
+            entity_id TEXT,
+            before JSONB,
+            after JSONB,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION audit_log_append_only() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'audit_log is append-only';
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'audit_log_no_modify') THEN
+                CREATE TRIGGER audit_log_no_modify BEFORE UPDATE OR DELETE ON audit_log
+                    FOR EACH ROW EXECUTE FUNCTION audit_log_append_only();
+            END IF;
+        END $$;
+    """)
+
     # Indexes
     cursor.execute("""
         CREATE INDEX IF NOT EXISTS idx_vehicle_status ON vehicles(status);
@@ -149,8 +536,37 @@ def init_db():
         CREATE INDEX IF NOT EXISTS idx_trip_status ON trips(status);
         CREATE INDEX IF NOT EXISTS idx_trip_vehicle ON trips(vehicle_id);
         CREATE INDEX IF NOT EXISTS idx_trip_driver ON trips(driver_id);
+        CREATE INDEX IF NOT EXISTS idx_trip_vehicle_completed ON trips(vehicle_id, completed_at) WHERE status = 'Completed';
+        CREATE INDEX IF NOT EXISTS idx_trip_lane_created ON trips(lane_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_trip_revenue_trip ON trip_revenue(trip_id);
+        CREATE INDEX IF NOT EXISTS idx_maintenance_vehicle_date ON maintenance_logs(vehicle_id, service_date);
+        CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(run_at, id) WHERE status = 'queued';
+        CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs(heartbeat_at) WHERE status = 'running';
+        CREATE INDEX IF NOT EXISTS idx_telemetry_recorded_brin ON telemetry_readings USING BRIN (recorded_at);
+        CREATE INDEX IF NOT EXISTS idx_audit_entity ON audit_log(entity, entity_id, id);
+        CREATE INDEX IF NOT EXISTS idx_audit_actor ON audit_log(actor, id);
     """)
 
+    # One reading per vehicle and timestamp, so ingest can skip a retried batch.
+    # Replaces the plain index; duplicates stored before it existed are dropped.
+    cursor.execute("SELECT to_regclass('idx_telemetry_reading_key')")
+    if cursor.fetchone()[0] is None:
+        cursor.execute("""
+            DELETE FROM telemetry_readings a USING telemetry_readings b
+            WHERE a.vehicle_id = b.vehicle_id AND a.recorded_at = b.recorded_at AND a.ctid > b.ctid
+        """)
+        cursor.execute("CREATE UNIQUE INDEX idx_telemetry_reading_key ON telemetry_readings(vehicle_id, recorded_at)")
+        cursor.execute("DROP INDEX IF EXISTS idx_telemetry_vehicle_time")
+
+    # Search indexes: tsvector for word-prefix type-ahead, trigram for typo matches
+    for table, doc in SEARCH_DOCUMENTS.items():
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_search_tsv ON {table} USING GIN (to_tsvector('simple', {doc}));
+            CREATE INDEX IF NOT EXISTS idx_{table}_fuzzy_trgm ON {table}
+                USING GIN ({SEARCH_FUZZY_DOCUMENTS[table]} gin_trgm_ops);
+            DROP INDEX IF EXISTS idx_{table}_search_trgm;
+        """)
+
     # Check to seed users
     cursor.execute("SELECT COUNT(*) FROM users")
     if cursor.fetchone()[0] == 0:
@@ -189,9 +605,9 @@ def init_db():
 # User CRUD Operations
 # ---------------------------------------------------------------------------
 
-def get_all_users():
+def get_all_users(primary: bool = False):
     """Return all users as a list of dicts."""
-    conn = get_connection()
+    conn = _connect(primary)
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cursor.execute("SELECT * FROM users ORDER BY id")
     rows = cursor.fetchall()
@@ -199,9 +615,9 @@ def get_all_users():
     return rows
 
 
-def get_user_by_id(user_id: int):
+def get_user_by_id(user_id: int, primary: bool = False):
     """Return a single user dict, or None."""
-    conn = get_connection()
+    conn = _connect(primary)
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
     row = cursor.fetchone()
@@ -215,43 +631,60 @@ def create_user(name: str, email: str, role: str, password: str = ""):
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     avatar = f"https://i.pravatar.cc/150?img={abs(hash(email)) % 70}"
     cursor.execute(
-        "INSERT INTO users (name, email, role, status, avatar, password_hash) VALUES (%s, %s, %s, 'active', %s, %s) RETURNING id",
+        "INSERT INTO users (name, email, role, status, avatar, password_hash) VALUES (%s, %s, %s, 'active', %s, %s) RETURNING *",
         (name, email, role, avatar, password),
     )
-    new_id = cursor.fetchone()['id']
+    user = cursor.fetchone()
     conn.commit()
     conn.close()
-    return get_user_by_id(new_id)
+    return user
 
 
 def update_user_role(user_id: int, new_role: str):
-    """Update a user's role. Returns the updated user or None."""
+    """Update a user's role. Returns (before, after) user dicts, or (None, None) if not found."""
+    rows = update_users_role([user_id], new_role)
+    return rows[0] if rows else (None, None)
+
+
+def delete_user(user_id: int):
+    """Delete a user by id. Returns the deleted row as a dict, or None."""
     conn = get_connection()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cursor.execute("UPDATE users SET role = %s WHERE id = %s", (new_role, user_id))
+    cursor.execute("DELETE FROM users WHERE id = %s RETURNING *", (user_id,))
+    row = cursor.fetchone()
     conn.commit()
     conn.close()
-    return get_user_by_id(user_id)
+    return row
 
 
-def delete_user(user_id: int):
-    """Delete a user by id. Returns True if a row was affected."""
+def update_users_role(user_ids, new_role: str):
+    """Set the role of many users in one UPDATE.
+    Returns a (before, after) pair of user dicts for every user that exists."""
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-    affected = cursor.rowcount
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(
+        """UPDATE users u SET role = %s
+           FROM (SELECT id, role FROM users WHERE id = ANY(%s) FOR UPDATE) prev
+           WHERE u.id = prev.id
+           RETURNING u.*, prev.role AS prev_role""",
+        (new_role, list(user_ids)),
+    )
+    pairs = []
+    for after in cursor.fetchall():
+        before = dict(after, role=after.pop('prev_role'))
+        pairs.append((before, after))
     conn.commit()
     conn.close()
-    return affected > 0
+    return pairs
 
 
 # ---------------------------------------------------------------------------
 # Vehicle CRUD Operations
 # ---------------------------------------------------------------------------
 
-def get_all_vehicles():
+def get_all_vehicles(primary: bool = False):
     """Return all vehicles as a list of dicts."""
-    conn = get_connection()
+    conn = _connect(primary)
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cursor.execute("SELECT * FROM vehicles ORDER BY id")
     rows = cursor.fetchall()
@@ -262,9 +695,9 @@ def get_all_vehicles():
     return rows
 
 
-def get_vehicle_by_id(vehicle_id: int):
+def get_vehicle_by_id(vehicle_id: int, primary: bool = False):
     """Return a single vehicle dict, or None."""
-    conn = get_connection()
+    conn = _connect(primary)
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cursor.execute("SELECT * FROM vehicles WHERE id = %s", (vehicle_id,))
     row = cursor.fetchone()
@@ -294,27 +727,181 @@ def create_vehicle(vehicle_id: str, make: str, model: str, year: int,
     new_id = cursor.fetchone()['id']
     conn.commit()
     conn.close()
-    return get_vehicle_by_id(new_id)
+    return get_vehicle_by_id(new_id, primary=True)
 
 
 def delete_vehicle(vehicle_db_id: int):
-    """Delete a vehicle by database id. Returns True if a row was affected."""
+    """Delete a vehicle by database id. Returns the deleted row as a dict, or None."""
+    conn = get_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute("DELETE FROM vehicles WHERE id = %s RETURNING *", (vehicle_db_id,))
+    row = cursor.fetchone()
+    conn.commit()
+    conn.close()
+    return row
+
+
+def delete_vehicles(vehicle_db_ids):
+    """Delete many vehicles in one statement.
+
+    Vehicles that still have trips are kept (trips reference them with ON
+    DELETE RESTRICT). Returns a dict of id -> (state, deleted_row) for every
+    id that exists, where state is 'deleted' or 'has_trips' and deleted_row
+    is the row as it was before deletion (None when kept). Missing ids are
+    absent.
+    """
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM vehicles WHERE id = %s", (vehicle_db_id,))
-    affected = cursor.rowcount
+    cursor.execute(
+        """WITH target AS (
+               SELECT v.id, EXISTS (SELECT 1 FROM trips t WHERE t.vehicle_id = v.id) AS has_trips
+               FROM vehicles v WHERE v.id = ANY(%s)
+               FOR UPDATE
+           ), deleted AS (
+               DELETE FROM vehicles WHERE id IN (SELECT id FROM target WHERE NOT has_trips)
+               RETURNING id, row_to_json(vehicles.*) AS row
+           )
+           SELECT t.id, t.has_trips, d.row FROM target t LEFT JOIN deleted d ON d.id = t.id""",
+        (list(vehicle_db_ids),),
+    )
+    outcome = {vid: ("has_trips" if has_trips else "deleted", row)
+               for vid, has_trips, row in cursor.fetchall()}
     conn.commit()
     conn.close()
-    return affected > 0
+    return outcome
+
+
+def update_vehicles_status(vehicle_ids, status: str):
+    """Set the status of many vehicles in one statement. Returns the ids that changed."""
+    if not vehicle_ids:
+        return []
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE vehicles SET status = %s WHERE id = ANY(%s) RETURNING id",
+        (status, list(vehicle_ids)),
+    )
+    changed = [r[0] for r in cursor.fetchall()]
+    conn.commit()
+    conn.close()
+    return changed
+
+
+# ---------------------------------------------------------------------------
+# Search
+# ---------------------------------------------------------------------------
+
+SEARCH_COLUMNS = {
+    "vehicles": "id, vehicle_id AS label, make || ' ' || model || ' - ' || license_plate AS detail",
+    "drivers": "id, name AS label, license_number AS detail",
+    "users": "id, name AS label, email AS detail",
+}
+
+
+# Shorter terms return nothing: one character matches most of every table
+SEARCH_MIN_LENGTH = 2
+# Typo-tolerant matching needs a few trigrams to be selective
+SEARCH_FUZZY_MIN_LENGTH = 4
+# pg_trgm's default (0.6) misses one-letter typos such as 'kenwrth' (0.55)
+SEARCH_FUZZY_THRESHOLD = 0.4
+# Matches ranked per table; bounds the work for short, unselective prefixes
+SEARCH_CANDIDATES = 200
+# Typo matches mostly tie (same name or model), so fewer need ranking
+SEARCH_FUZZY_CANDIDATES = 50
+
+
+def _prefix_tsquery(term: str):
+    """Turn free text into a 'word:* & word:*' prefix query, or None if no words."""
+    words = re.findall(r"\w+", term.lower())
+    if not words:
+        return None
+    # The 'simple' parser reads the digits after a hyphen as a signed number:
+    # 'FF-0000012' is 'ff' and '-0000012'. Let a numeric word match either form.
+    return " & ".join(f"('{w}':* | '-{w}':*)" if w[0].isdigit() else f"{w}:*" for w in words)
+
+
+def search(term: str, types=None, limit: int = 10, primary: bool = False):
+    """Ranked prefix + fuzzy search over vehicles, drivers and users.
+
+    Returns up to ``limit`` dicts with ``type``, ``id``, ``label``, ``detail``
+    and ``rank``, best match first. Word-prefix matches come first; only when
+    there are fewer than ``limit`` of them do typo-tolerant matches (trigram
+    word similarity against the closest word of the fuzzy document) fill the
+    rest. At most ``SEARCH_CANDIDATES`` prefix and ``SEARCH_FUZZY_CANDIDATES``
+    typo matches per table are ranked, so very short prefixes return good
+    matches, not necessarily the best. Runs as one statement, one round trip,
+on a connection the calling thread keeps open between searches.
+    """
+    types = [t for t in (types or SEARCH_DOCUMENTS) if t in SEARCH_DOCUMENTS]
+    term = term.strip()
+    tsq = _prefix_tsquery(term)
+    if len(term) < SEARCH_MIN_LENGTH or not types or not tsq:
+        return []
+    fuzzy = len(term) >= SEARCH_FUZZY_MIN_LENGTH
+
+    prefix = " UNION ALL ".join(f"""(
+        SELECT '{table}' AS type, id, label, detail, 0 AS tier,
+               ts_rank(to_tsvector('simple', doc), to_tsquery('simple', %(tsq)s))
+                   + word_similarity(%(term)s, doc) AS rank
+        FROM (
+            SELECT {SEARCH_COLUMNS[table]}, {SEARCH_DOCUMENTS[table]} AS doc FROM {table}
+            WHERE to_tsvector('simple', {SEARCH_DOCUMENTS[table]}) @@ to_tsquery('simple', %(tsq)s)
+            LIMIT %(candidates)s
+        ) candidates
+        ORDER BY rank DESC LIMIT %(limit)s
+    )""" for table in types)
+    # The COUNT is evaluated once, before any scan: a full page of prefix
+    # matches skips the typo branches entirely
+    typo = " UNION ALL ".join(f"""(
+        SELECT '{table}' AS type, id, label, detail, 1 AS tier, word_similarity(%(term)s, doc) AS rank
+        FROM (
+            SELECT {SEARCH_COLUMNS[table]}, {SEARCH_FUZZY_DOCUMENTS[table]} AS doc FROM {table}
+            WHERE (SELECT COUNT(*) FROM prefix) < %(limit)s
+              AND %(term)s <%% {SEARCH_FUZZY_DOCUMENTS[table]}
+            LIMIT %(fuzzy_candidates)s
+        ) candidates
+        ORDER BY rank DESC LIMIT %(limit)s
+    )""" for table in types) if fuzzy else "SELECT * FROM prefix WHERE FALSE"
+    # SET LOCAL lasts only for this transaction, which is never committed. The
+    # planner guesses ~1000 typo matches per table and would seq scan for the
+    # first 50, computing word_similarity on every row when there are none;
+    # every branch here has an index, so rule seq scans out.
+    sql = f"""SET LOCAL pg_trgm.word_similarity_threshold = {float(SEARCH_FUZZY_THRESHOLD)};
+        SET LOCAL enable_seqscan = off;
+        WITH prefix AS ({prefix}),
+        typo AS ({typo})
+        SELECT type, id, label, detail, rank FROM (
+            SELECT DISTINCT ON (type, id) * FROM (SELECT * FROM prefix UNION ALL SELECT * FROM typo) matches
+            ORDER BY type, id, tier, rank DESC
+        ) best
+        ORDER BY tier, rank DESC LIMIT %(limit)s"""
+
+    params = {"tsq": tsq, "term": term, "limit": limit, "candidates": SEARCH_CANDIDATES,
+              "fuzzy_candidates": SEARCH_FUZZY_CANDIDATES}
+    for attempt in range(2):
+        conn = _connect(primary, _search_connect)
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        except psycopg2.OperationalError:
+            # The server dropped the kept connection since the last search;
+            # retry once on a new one
+            if attempt or not conn.closed:
+                raise
+        finally:
+            # The connection stays open for the next search; end the transaction
+            if not conn.closed:
+                conn.rollback()
 
 
 # ---------------------------------------------------------------------------
 # Auth Helpers
 # ---------------------------------------------------------------------------
 
-def get_user_by_email(email: str):
+def get_user_by_email(email: str, primary: bool = False):
     """Return a single user dict looked up by email, or None."""
-    conn = get_connection()
+    conn = _connect(primary)
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
     row = cursor.fetchone()
@@ -324,7 +911,8 @@ def get_user_by_email(email: str):
 
 def verify_login(email: str, password: str):
     """Verify email + password. Returns user dict if valid, None otherwise."""
-    user = get_user_by_email(email)
+    # Login right after sign-up must see the new row, so read from the primary
+    user = get_user_by_email(email, primary=True)
     if not user:
         return None
     stored_pw = user.get("password_hash", "")
@@ -335,3 +923,140 @@ def verify_login(email: str, password: str):
     if password == stored_pw:
         return user
     return None
+
+
+# ---------------------------------------------------------------------------
+# Trip & Maintenance Helpers
+# ---------------------------------------------------------------------------
+
+def complete_trip(trip_id: int, end_odometer: float):
+    """Mark a dispatched trip as completed and roll the vehicle odometer forward.
+    Returns (before, after, vehicle_change) where before/after are trip dicts and
+    vehicle_change is a (before, after) pair of vehicle dicts, or None if the
+    odometer did not move. Returns (None, None, None) if no dispatched trip matched.
+    Raises ValueError if ``end_odometer`` is below the trip's start_odometer."""
+    conn = get_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(
+        """UPDATE trips t
+           SET status = 'Completed', end_odometer = %(end)s, completed_at = CURRENT_TIMESTAMP
+           FROM (SELECT id, status, start_odometer, end_odometer, completed_at FROM trips
+                 WHERE id = %(id)s AND status = 'Dispatched' FOR UPDATE) prev
+           WHERE t.id = prev.id AND (prev.start_odometer IS NULL OR prev.start_odometer <= %(end)s)
+           RETURNING t.*, prev.status AS prev_status, prev.end_odometer AS prev_end_odometer,
+                     prev.completed_at AS prev_completed_at""",
+        {"end": end_odometer, "id": trip_id},
+    )
+    trip = cursor.fetchone()
+    if not trip:
+        # Either no dispatched trip, or one whose start reading is above end_odometer
+        cursor.execute("SELECT start_odometer FROM trips WHERE id = %s AND status = 'Dispatched'", (trip_id,))
+        dispatched = cursor.fetchone()
+        conn.rollback()
+        conn.close()
+        if dispatched:
+            raise ValueError(f"end_odometer must be at least the trip's start_odometer "
+                             f"({dispatched['start_odometer']})")
+        return None, None, None
+    before = dict(trip, status=trip.pop('prev_status'), end_odometer=trip.pop('prev_end_odometer'),
+                  completed_at=trip.pop('prev_completed_at'))
+    cursor.execute(
+        """UPDATE vehicles v SET odometer = %s
+           FROM (SELECT id, odometer FROM vehicles WHERE id = %s FOR UPDATE) prev
+           WHERE v.id = prev.id AND prev.odometer < %s
+           RETURNING v.*, prev.odometer AS prev_odometer""",
+        (end_odometer, trip['vehicle_id'], end_odometer),
+    )
+    vehicle = cursor.fetchone()
+    vehicle_change = (dict(vehicle, odometer=vehicle.pop('prev_odometer')), vehicle) if vehicle else None
+    conn.commit()
+    conn.close()
+    return before, trip, vehicle_change
+
+
+def get_vehicle_service_stats(vehicle_ids=None, rate_window_days: int = 90, primary: bool = False):
+    """Return per-vehicle service inputs for the maintenance scheduler.
+
+    Each row carries the last service date (falling back to the vehicle's
+    creation date), the distance driven on completed trips since then, and the
+    distance driven inside the trailing rate window. Pass ``vehicle_ids`` to
+    restrict the scan to a handful of vehicles.
+    """
+    conn = _connect(primary)
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    query = """
+        SELECT v.id AS vehicle_id,
+               v.vehicle_type,
+               COALESCE(ls.last_service, v.created_at::date) AS last_service,
+               COALESCE(SUM(t.end_odometer - t.start_odometer)
+                        FILTER (WHERE t.completed_at > COALESCE(ls.last_service, v.created_at::date)), 0) AS km_since_service,
+               COALESCE(SUM(t.end_odometer - t.start_odometer)
+                        FILTER (WHERE t.completed_at >= CURRENT_DATE - %s), 0) AS km_recent
+        FROM vehicles v
+        LEFT JOIN (
+            SELECT vehicle_id, MAX(service_date) AS last_service
+            FROM maintenance_logs GROUP BY vehicle_id
+        ) ls ON ls.vehicle_id = v.id
+        LEFT JOIN trips t
+               ON t.vehicle_id = v.id AND t.status = 'Completed'
+              AND t.start_odometer IS NOT NULL AND t.end_odometer IS NOT NULL
+        WHERE v.status <> 'Retired'
+    """
+    params = [rate_window_days]
+    if vehicle_ids is not None:
+        query += " AND v.id = ANY(%s)"
+        params.append(list(vehicle_ids))
+    query += " GROUP BY v.id, v.vehicle_type, ls.last_service"
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+def mark_vehicles_in_shop(vehicle_ids):
+    """Flip the given vehicles to 'In Shop' in one statement.
+    Vehicles that are on a trip, already in the shop or retired are left alone.
+    Returns (changed ids, ids skipped because they are on a trip)."""
+    if not vehicle_ids:
+        return [], []
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        """WITH target AS (
+               SELECT id, status FROM vehicles WHERE id = ANY(%s) FOR UPDATE
+           ),
+           flipped AS (
+               UPDATE vehicles v SET status = 'In Shop'
+               FROM target t
+               WHERE v.id = t.id AND t.status IN ('Available', 'Active')
+               RETURNING v.id
+           )
+           SELECT id, TRUE FROM flipped
+           UNION ALL
+           SELECT id, FALSE FROM target WHERE status = 'On Trip'""",
+        (list(vehicle_ids),),
+    )
+    rows = cursor.fetchall()
+    conn.commit()
+    conn.close()
+    return [vid for vid, flipped in rows if flipped], [vid for vid, flipped in rows if not flipped]
+
+
+def log_maintenance(vehicle_id: int, description: str, cost: float, service_date=None):
+    """Record a completed service and release the vehicle from the shop.
+    Returns the new log dict, or None if the vehicle doesn't exist."""
+    conn = get_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(
+        """INSERT INTO maintenance_logs (vehicle_id, description, cost, service_date)
+           SELECT id, %s, %s, COALESCE(%s, CURRENT_DATE) FROM vehicles WHERE id = %s
+           RETURNING *""",
+        (description, cost, service_date, vehicle_id),
+    )
+    log = cursor.fetchone()
+    if log:
+        cursor.execute("UPDATE vehicles SET status = 'Available' WHERE id = %s AND status = 'In Shop'",
+                       (vehicle_id,))
+    conn.commit()
+    conn.close()
+    return log
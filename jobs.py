@@ -0,0 +1,358 @@
+"""
+FleetFlow - Background Job Queue
+Postgres-backed job queue for work that should not run inside a request.
+
+Jobs are rows in the ``jobs`` table (created by database.init_db). API
+handlers call ``enqueue`` and return the job id straight away; worker
+processes claim ready jobs with ``FOR UPDATE SKIP LOCKED`` so any number of
+workers can poll the same table without handing out a job twice. Failed jobs
+are retried with exponential backoff until ``max_attempts`` is reached;
+errors that retrying cannot fix (bad payloads, invalid values) fail at once.
+While a handler runs, a side thread refreshes the job's heartbeat; a job
+whose heartbeat goes stale for ``LEASE_SECONDS`` is handed to another
+worker, and the old worker can no longer change its row.
+Enqueue sends a NOTIFY so idle workers wake immediately instead of waiting
+out their poll interval. No external broker is needed. Between jobs, every
+worker also folds dirty lane aggregates in (``lanes.refresh``) at most every
+``LANES_REFRESH_SECONDS``, so the analytics endpoint only has to read. Each
+pass is capped at ``LANES_REFRESH_MAX_BATCHES`` so a large backlog (say after
+a bulk import) cannot keep a worker from its jobs; enqueue a
+``lanes.refresh`` job to drain one in full.
+
+Run a local worker pool with:
+
+    python jobs.py --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import select
+import socket
+import threading
+import time
+import traceback
+
+import psycopg2
+import psycopg2.extras
+
+import database
+import lanes
+import telemetry
+
+NOTIFY_CHANNEL = "fleetflow_jobs"
+POLL_SECONDS = 5
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 600
+# A running job whose heartbeat is older than this is assumed to have lost its worker
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = LEASE_SECONDS / 5
+# Upper bound on how stale lane analytics get while workers are running
+LANES_REFRESH_SECONDS = 30
+LANES_REFRESH_MAX_BATCHES = 2
+
+# kind -> callable(payload: dict, job: JobContext) -> JSON-serialisable result
+HANDLERS = {}
+
+
+class PermanentError(Exception):
+    """Raise from a handler for failures a retry cannot fix; the job fails immediately."""
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker now owns it."""
+
+
+# Besides PermanentError, these mean the payload itself is bad
+NON_RETRYABLE = (PermanentError, KeyError, TypeError, ValueError,
+                 psycopg2.DataError, psycopg2.IntegrityError)
+
+
+def job_handler(kind: str):
+    """Register a function as the handler for a job kind."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Producer side (called from API handlers)
+# ---------------------------------------------------------------------------
+
+def enqueue(kind: str, payload: dict = None, max_attempts: int = 5, delay_seconds: int = 0):
+    """Insert a job and return it as a dict."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    conn = database.get_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(
+        """INSERT INTO jobs (kind, payload, max_attempts, run_at)
+           VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+           RETURNING *""",
+        (kind, psycopg2.extras.Json(payload or {}), max_attempts, delay_seconds),
+    )
+    job = cursor.fetchone()
+    cursor.execute(f"NOTIFY {NOTIFY_CHANNEL}")
+    conn.commit()
+    conn.close()
+    return job
+
+
+def get_job(job_id: int):
+    """Return a single job dict, or None."""
+    conn = database.get_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(
+        """SELECT id, kind, status, attempts, max_attempts, progress, progress_message,
+                  result, last_error, run_at, created_at, started_at, finished_at
+           FROM jobs WHERE id = %s""",
+        (job_id,),
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+class JobContext:
+    """Handed to job handlers so they can report progress."""
+
+    def __init__(self, conn, row, worker_id: str):
+        self.conn = conn
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.attempt = row["attempts"]
+        self.worker_id = worker_id
+
+    def report(self, progress: float, message: str = ""):
+        """Record progress (0-100). Raises LeaseLost if another worker took the job over."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """UPDATE jobs SET progress = %s, progress_message = %s, heartbeat_at = CURRENT_TIMESTAMP
+               WHERE id = %s AND locked_by = %s""",
+            (max(0, min(100, progress)), message, self.id, self.worker_id),
+        )
+        self.conn.commit()
+        if cursor.rowcount == 0:
+            raise LeaseLost(f"Job {self.id} is no longer owned by {self.worker_id}")
+
+
+class _Heartbeat:
+    """Keeps a running job's lease fresh from a side thread, on its own connection."""
+
+    def __init__(self, job_id: int, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-{job_id}-heartbeat", daemon=True)
+
+    def _run(self):
+        conn = None
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                if conn is None or conn.closed:
+                    conn = database.get_connection()
+                    conn.autocommit = True
+                conn.cursor().execute(
+                    "UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = %s AND locked_by = %s",
+                    (self.job_id, self.worker_id),
+                )
+            except psycopg2.Error as exc:
+                print(f"Job {self.job_id}: heartbeat failed: {exc}")
+        if conn is not None:
+            conn.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def claim_job(conn, worker_id: str):
+    """Atomically claim the next ready job, or return None."""
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    # Abandoned jobs that already used every attempt fail instead of running again
+    cursor.execute(
+        """UPDATE jobs SET status = 'failed', finished_at = CURRENT_TIMESTAMP, locked_by = NULL,
+               last_error = COALESCE(last_error || E'\\n', '') || 'Lease expired on final attempt'
+           WHERE status = 'running' AND attempts >= max_attempts
+             AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)""",
+        (LEASE_SECONDS,),
+    )
+    cursor.execute(
+        """UPDATE jobs
+           SET status = 'running', attempts = attempts + 1, locked_by = %s,
+               started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+           WHERE id = (
+               SELECT id FROM jobs
+               WHERE (status = 'queued' AND run_at <= CURRENT_TIMESTAMP)
+                  OR (status = 'running' AND attempts < max_attempts
+                      AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+               ORDER BY run_at, id
+               FOR UPDATE SKIP LOCKED
+               LIMIT 1
+           )
+           RETURNING *""",
+        (worker_id, LEASE_SECONDS),
+    )
+    row = cursor.fetchone()
+    conn.commit()
+    return row
+
+
+def _finish(conn, row, worker_id: str, result):
+    cursor = conn.cursor()
+    cursor.execute(
+        """UPDATE jobs SET status = 'succeeded', progress = 100, result = %s,
+               finished_at = CURRENT_TIMESTAMP, locked_by = NULL
+           WHERE id = %s AND locked_by = %s""",
+        (psycopg2.extras.Json(result), row["id"], worker_id),
+    )
+    conn.commit()
+    if cursor.rowcount == 0:
+        print(f"Job {row['id']}: lease lost before finishing; result discarded")
+
+
+def _fail(conn, row, worker_id: str, error: str, retryable: bool = True):
+    """Reschedule with exponential backoff, or mark failed once attempts run out."""
+    conn.rollback()
+    cursor = conn.cursor()
+    if not retryable or row["attempts"] >= row["max_attempts"]:
+        cursor.execute(
+            """UPDATE jobs SET status = 'failed', last_error = %s,
+                   finished_at = CURRENT_TIMESTAMP, locked_by = NULL
+               WHERE id = %s AND locked_by = %s""",
+            (error, row["id"], worker_id),
+        )
+    else:
+        delay = min(BACKOFF_BASE_SECONDS ** row["attempts"], BACKOFF_MAX_SECONDS)
+        cursor.execute(
+            """UPDATE jobs SET status = 'queued', last_error = %s, locked_by = NULL,
+                   run_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+               WHERE id = %s AND locked_by = %s""",
+            (error, delay, row["id"], worker_id),
+        )
+    conn.commit()
+
+
+def run_one(conn, worker_id: str):
+    """Claim and run a single job. Returns True if a job was processed."""
+    row = claim_job(conn, worker_id)
+    if not row:
+        return False
+    handler = HANDLERS.get(row["kind"])
+    try:
+        if handler is None:
+            raise PermanentError(f"No handler registered for job kind '{row['kind']}'")
+        with _Heartbeat(row["id"], worker_id):
+            result = handler(row["payload"], JobContext(conn, row, worker_id))
+        _finish(conn, row, worker_id, result)
+    except LeaseLost as exc:
+        conn.rollback()
+        print(f"Job {row['id']}: {exc}; abandoning")
+    except NON_RETRYABLE:
+        _fail(conn, row, worker_id, traceback.format_exc(limit=5), retryable=False)
+    except Exception:
+        _fail(conn, row, worker_id, traceback.format_exc(limit=5))
+    return True
+
+
+def _refresh_lanes_if_due(next_at: float):
+    """Run a bounded lanes.refresh once ``next_at`` has passed. Returns when it is next due."""
+    now = time.monotonic()
+    if now < next_at:
+        return next_at
+    try:
+        lanes.refresh(max_batches=LANES_REFRESH_MAX_BATCHES)
+    except psycopg2.Error as exc:
+        print(f"Lane refresh failed: {exc}")
+    return now + LANES_REFRESH_SECONDS
+
+
+def worker_loop(worker_id: str, stop_event=None):
+    """Process jobs until ``stop_event`` is set, sleeping on LISTEN when idle."""
+    conn = database.get_connection()
+    listen_conn = database.get_connection()
+    listen_conn.autocommit = True
+    listen_conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+    next_lanes_refresh = time.monotonic()
+    try:
+        while not (stop_event and stop_event.is_set()):
+            next_lanes_refresh = _refresh_lanes_if_due(next_lanes_refresh)
+            if run_one(conn, worker_id):
+                continue
+            # Idle: wait for a NOTIFY or the poll interval (retries become ready on their own)
+            if select.select([listen_conn], [], [], POLL_SECONDS) != ([], [], []):
+                listen_conn.poll()
+                listen_conn.notifies.clear()
+    finally:
+        conn.close()
+        listen_conn.close()
+
+
+def _worker_main(index: int, stop_event):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    print(f"Job worker {worker_id} started")
+    try:
+        worker_loop(worker_id, stop_event)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_pool(workers: int):
+    """Start ``workers`` worker processes and block until interrupted."""
+    stop_event = multiprocessing.Event()
+    procs = [multiprocessing.Process(target=_worker_main, args=(i, stop_event), daemon=True)
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        stop_event.set()
+        for p in procs:
+            p.join(timeout=POLL_SECONDS + 1)
+
+
+# ---------------------------------------------------------------------------
+# Built-in handlers
+# ---------------------------------------------------------------------------
+
+@job_handler("vehicles.set_status")
+def set_vehicles_status(payload, job):
+    """Mass status update, applied in chunks so progress is visible."""
+    ids = payload["vehicle_ids"]
+    status = payload["status"]
+    chunk = 1000
+    changed = 0
+    for i in range(0, len(ids), chunk):
+        changed += len(database.update_vehicles_status(ids[i:i + chunk], status))
+        job.report(100.0 * min(i + chunk, len(ids)) / max(len(ids), 1), f"{changed} vehicles updated")
+    return {"updated": changed}
+
+
+@job_handler("telemetry.prune")
+def prune_telemetry(payload, job):
+    """Drop raw readings and fine rollups past their retention."""
+    return telemetry.prune()
+
+
+@job_handler("lanes.refresh")
+def refresh_lanes(payload, job):
+    """Recompute every dirty per-lane daily aggregate now, without waiting for the workers' schedule."""
+    return {"refreshed": lanes.refresh()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run FleetFlow background job workers.")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = parser.parse_args()
+    run_pool(args.workers)
@@ -0,0 +1,136 @@
+"""
+FleetFlow - Lane Analytics
+Per origin-destination lane volume, cargo, revenue and turnaround.
+
+Each distinct (origin, destination) pair, compared case- and
+whitespace-insensitively, is one row in ``lanes``. A BEFORE trigger on
+``trips`` sets ``trips.lane_id`` when a trip is created or re-routed,
+creating the lane on first use, so every write path (API, COPY, psql) is
+covered.
+
+``lane_daily_stats`` holds one row per lane per trip-creation day. Counts
+cover dispatched and completed trips; turnaround covers completed trips
+only. Statement-level triggers on ``trips`` and ``trip_revenue`` record the
+(lane, day) pairs each write touched in ``lane_stats_dirty``. ``refresh``
+recomputes only those days from the (lane_id, created_at) index, so top-lane
+queries sum at most one row per lane per day instead of grouping raw trips.
+
+``refresh`` runs in the job workers (jobs.py) every ``LANES_REFRESH_SECONDS``,
+a few batches at a time, never in a request; the ``lanes.refresh`` job
+drains a large backlog (after a bulk import) in one go. ``top_lanes`` reads
+from a replica, so its figures can trail trip writes by that interval plus
+replica lag (at most ``database.REPLICA_MAX_LAG_SECONDS``), longer while a
+backlog is draining. Analytics do not need to be fresher; callers that do
+should refresh and read from the primary.
+"""
+from datetime import date
+
+import psycopg2.extras
+
+import database
+
+REFRESH_BATCH_SIZE = 5000
+TOP_LANES_MAX = 100
+
+# Query parameter -> aggregate to rank by
+SORT_COLUMNS = {
+    "trips": "trips",
+    "revenue": "revenue",
+    "cargo_weight": "cargo_weight_sum",
+}
+
+_REFRESH_SQL = """
+    WITH claimed AS (
+        DELETE FROM lane_stats_dirty
+        WHERE (lane_id, day) IN (
+            SELECT lane_id, day FROM lane_stats_dirty LIMIT %s FOR UPDATE SKIP LOCKED
+        )
+        RETURNING lane_id, day
+    ),
+    fresh AS (
+        SELECT c.lane_id, c.day,
+               COUNT(t.id) AS trips,
+               COALESCE(SUM(t.cargo_weight), 0) AS cargo_weight_sum,
+               COALESCE(SUM(r.revenue), 0) AS revenue,
+               COUNT(t.completed_at) FILTER (WHERE t.status = 'Completed') AS completed_trips,
+               COALESCE(SUM(EXTRACT(EPOCH FROM t.completed_at - t.created_at))
+                        FILTER (WHERE t.status = 'Completed'), 0) AS turnaround_seconds_sum
+        FROM claimed c
+        LEFT JOIN trips t
+               ON t.lane_id = c.lane_id AND t.created_at >= c.day AND t.created_at < c.day + 1
+              AND t.status IN ('Dispatched', 'Completed')
+        LEFT JOIN LATERAL (
+            SELECT SUM(revenue_amount) AS revenue FROM trip_revenue WHERE trip_id = t.id
+        ) r ON TRUE
+        GROUP BY c.lane_id, c.day
+    ),
+    emptied AS (
+        DELETE FROM lane_daily_stats s USING fresh f
+        WHERE f.trips = 0 AND s.day = f.day AND s.lane_id = f.lane_id
+    ),
+    upserted AS (
+        INSERT INTO lane_daily_stats AS s
+            (day, lane_id, trips, cargo_weight_sum, revenue, completed_trips, turnaround_seconds_sum)
+        SELECT day, lane_id, trips, cargo_weight_sum, revenue, completed_trips, turnaround_seconds_sum
+        FROM fresh WHERE trips > 0
+        ON CONFLICT (day, lane_id) DO UPDATE SET
+            trips = EXCLUDED.trips,
+            cargo_weight_sum = EXCLUDED.cargo_weight_sum,
+            revenue = EXCLUDED.revenue,
+            completed_trips = EXCLUDED.completed_trips,
+            turnaround_seconds_sum = EXCLUDED.turnaround_seconds_sum
+    )
+    SELECT COUNT(*) FROM claimed
+"""
+
+
+def refresh(max_batches: int = None):
+    """Recompute dirty (lane, day) aggregates. Returns how many lane-days were refreshed.
+
+    Runs batches of ``REFRESH_BATCH_SIZE`` until nothing is dirty, or at most
+    ``max_batches`` of them. Concurrent callers claim disjoint lane-days.
+    """
+    refreshed = 0
+    batches = 0
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    while max_batches is None or batches < max_batches:
+        cursor.execute(_REFRESH_SQL, (REFRESH_BATCH_SIZE,))
+        claimed = cursor.fetchone()[0]
+        conn.commit()
+        refreshed += claimed
+        batches += 1
+        if claimed < REFRESH_BATCH_SIZE:
+            break
+    conn.close()
+    return refreshed
+
+
+def top_lanes(start: date, end: date, limit: int = 10, sort: str = "trips"):
+    """Top lanes by ``sort`` for trips created between ``start`` and ``end`` (inclusive)."""
+    order = SORT_COLUMNS[sort]
+    conn = database.get_read_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(
+        f"""WITH totals AS (
+                SELECT lane_id, SUM(trips) AS trips, SUM(cargo_weight_sum) AS cargo_weight_sum,
+                       SUM(revenue) AS revenue, SUM(completed_trips) AS completed_trips,
+                       SUM(turnaround_seconds_sum) AS turnaround_seconds_sum
+                FROM lane_daily_stats
+                WHERE day >= %s AND day <= %s
+                GROUP BY lane_id
+                ORDER BY {order} DESC, lane_id
+                LIMIT %s
+            )
+            SELECT l.id AS lane_id, l.origin, l.destination, t.trips,
+                   ROUND(t.cargo_weight_sum / t.trips, 2) AS avg_cargo_weight,
+                   t.revenue, t.completed_trips,
+                   ROUND((t.turnaround_seconds_sum / NULLIF(t.completed_trips, 0) / 3600)::numeric, 2)
+                       AS avg_turnaround_hours
+            FROM totals t JOIN lanes l ON l.id = t.lane_id
+            ORDER BY t.{order} DESC, l.id""",
+        (start, end, max(1, min(limit, TOP_LANES_MAX))),
+    )
+    lanes = cursor.fetchall()
+    conn.close()
+    return lanes
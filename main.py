@@ -2,9 +2,16 @@ from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from datetime import date, datetime, timedelta
+from typing import List, Optional
 import database
+from maintenance_scheduler import scheduler as maintenance_scheduler
+import jobs
+import telemetry
+import lanes
+import audit
+import ratelimit
 
 app = FastAPI()
 
@@ -19,6 +26,45 @@ templates = Jinja2Templates(directory="templates")
 # ---------------------------------------------------------------------------
 database.init_db()
 
+@app.on_event("startup")
+def start_background_workers():
+    if database.DATABASE_URL:
+        maintenance_scheduler.start()
+        audit.log.start()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    maintenance_scheduler.stop()
+    if database.DATABASE_URL:
+        audit.log.stop()
+
+# ---------------------------------------------------------------------------
+# Read-your-writes: after a successful write, the client's reads skip the
+# replicas for a few seconds, so reloading a list shows the change.
+# ---------------------------------------------------------------------------
+RECENT_WRITE_COOKIE = "ff_recent_write"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    token = database.read_from_primary.set(RECENT_WRITE_COOKIE in request.cookies)
+    try:
+        response = await call_next(request)
+    finally:
+        database.read_from_primary.reset(token)
+    if request.method in WRITE_METHODS and response.status_code < 400:
+        response.set_cookie(RECENT_WRITE_COOKIE, "1", max_age=int(database.READ_YOUR_WRITES_SECONDS),
+                            httponly=True, samesite="lax")
+    return response
+
+def _actor(request: Request):
+    """Who is making the change: the X-User-Email header, else the client IP.
+
+    The SPA sends the signed-in user's email (static/js/app.js, apiHeaders).
+    There is no server-side session, so this names the actor; it does not prove it.
+    """
+    return request.headers.get("x-user-email") or (request.client.host if request.client else "")
+
 class RoleUpdate(BaseModel):
     role: str
 
@@ -36,28 +82,68 @@ def get_users():
     return database.get_all_users()
 
 @app.put("/api/users/{user_id}/role")
-def update_user_role(user_id: int, body: RoleUpdate):
-    user = database.update_user_role(user_id, body.role)
+def update_user_role(user_id: int, body: RoleUpdate, request: Request):
+    before, user = database.update_user_role(user_id, body.role)
     if user:
+        audit.log.record("update_role", "user", user_id, before, user, _actor(request))
         return {"success": True, "user": user}
     return JSONResponse(status_code=404, content={"error": "User not found"})
 
 import psycopg2
 
+# Upper bound on ids accepted by the batch endpoints
+BATCH_MAX_SIZE = 500
+
+class BatchRoleUpdate(BaseModel):
+    user_ids: List[int]
+    role: str
+
+class BatchVehicleDelete(BaseModel):
+    vehicle_ids: List[int]
+
+def _batch_too_large(ids):
+    if len(ids) > BATCH_MAX_SIZE:
+        return JSONResponse(status_code=413, content={"error": f"Batch size exceeds {BATCH_MAX_SIZE} ids"})
+    return None
+
+@app.put("/api/users/role")
+def update_users_role(body: BatchRoleUpdate, request: Request):
+    too_large = _batch_too_large(body.user_ids)
+    if too_large:
+        return too_large
+    ids = list(dict.fromkeys(body.user_ids))
+    try:
+        pairs = database.update_users_role(ids, body.role)
+    except psycopg2.DataError:
+        return JSONResponse(status_code=400, content={"error": f"Invalid role: {body.role}"})
+    actor = _actor(request)
+    updated = {}
+    for before, after in pairs:
+        audit.log.record("update_role", "user", after["id"], before, after, actor)
+        updated[after["id"]] = after
+    results = [
+        {"id": uid, "success": True, "user": updated[uid]} if uid in updated
+        else {"id": uid, "success": False, "error": "User not found"}
+        for uid in ids
+    ]
+    return {"success": all(r["success"] for r in results), "results": results}
+
 @app.post("/api/users")
-def create_user(body: UserCreate):
+def create_user(body: UserCreate, request: Request):
     if body.role.lower() == "admin":
         return JSONResponse(status_code=403, content={"detail": "Cannot register as admin. Only one admin is allowed."})
     try:
         user = database.create_user(body.name, body.email, body.role, body.password)
+        audit.log.record("create", "user", user["id"], None, user, _actor(request))
         return {"success": True, "user": user}
     except psycopg2.IntegrityError:
         return JSONResponse(status_code=400, content={"detail": "Registration failed. Email may already exist."})
 
 @app.delete("/api/users/{user_id}")
-def delete_user(user_id: int):
+def delete_user(user_id: int, request: Request):
     deleted = database.delete_user(user_id)
     if deleted:
+        audit.log.record("delete", "user", user_id, deleted, None, _actor(request))
         return {"success": True}
     return JSONResponse(status_code=404, content={"error": "User not found"})
 
@@ -77,18 +163,42 @@ def get_vehicles():
     return database.get_all_vehicles()
 
 @app.post("/api/vehicles")
-def create_vehicle(body: VehicleCreate):
+def create_vehicle(body: VehicleCreate, request: Request):
     vehicle = database.create_vehicle(
         body.vehicle_id, body.make, body.model, body.year,
         body.vehicle_type, body.vehicle_class, body.mileage,
         body.vin, body.license_plate,
     )
+    audit.log.record("create", "vehicle", vehicle["id"], None, vehicle, _actor(request))
     return {"success": True, "vehicle": vehicle}
 
+@app.post("/api/vehicles/batch-delete")
+def delete_vehicles(body: BatchVehicleDelete, request: Request):
+    too_large = _batch_too_large(body.vehicle_ids)
+    if too_large:
+        return too_large
+    ids = list(dict.fromkeys(body.vehicle_ids))
+    outcome = database.delete_vehicles(ids)
+    actor = _actor(request)
+    results = []
+    for vid in ids:
+        state, before = outcome.get(vid, (None, None))
+        if state == "deleted":
+            maintenance_scheduler.remove(vid)
+            audit.log.record("delete", "vehicle", vid, before, None, actor)
+            results.append({"id": vid, "success": True})
+        elif state == "has_trips":
+            results.append({"id": vid, "success": False, "error": "Vehicle has trips"})
+        else:
+            results.append({"id": vid, "success": False, "error": "Vehicle not found"})
+    return {"success": all(r["success"] for r in results), "results": results}
+
 @app.delete("/api/vehicles/{vehicle_db_id}")
-def delete_vehicle(vehicle_db_id: int):
+def delete_vehicle(vehicle_db_id: int, request: Request):
     deleted = database.delete_vehicle(vehicle_db_id)
     if deleted:
+        maintenance_scheduler.remove(vehicle_db_id)
+        audit.log.record("delete", "vehicle", vehicle_db_id, deleted, None, _actor(request))
         return {"success": True}
     return JSONResponse(status_code=404, content={"error": "Vehicle not found"})
 
@@ -96,17 +206,151 @@ class LoginRequest(BaseModel):
     email: str
     password: str = ""
 
+# Login throttling: token buckets per client IP and per email, plus a cap on
+# concurrent verifications (each one is a primary-database lookup)
+LOGIN_VERIFY_CONCURRENCY = 16
+login_throttle = ratelimit.LoginThrottle("api-login", ratelimit.backend_from_env())
+login_gate = ratelimit.AdmissionGate(LOGIN_VERIFY_CONCURRENCY)
+
 @app.post("/api/login")
-def login_user(body: LoginRequest):
-    user = database.verify_login(body.email, body.password)
+def login_user(body: LoginRequest, request: Request):
+    ip = request.client.host if request.client else ""
+    retry_after = login_throttle.check(ip, body.email)
+    if retry_after:
+        return JSONResponse(status_code=429, content={"error": "Too many login attempts. Please try again later."},
+                            headers=ratelimit.retry_after_header(retry_after))
+    try:
+        with login_gate:
+            user = database.verify_login(body.email, body.password)
+            # Check if user exists but password is wrong
+            existing = user or database.get_user_by_email(body.email, primary=True)
+    except ratelimit.Overloaded as exc:
+        return JSONResponse(status_code=429, content={"error": "Login is busy. Please try again shortly."},
+                            headers=ratelimit.retry_after_header(exc.retry_after))
     if user:
         return {"success": True, "user": user}
-    # Check if user exists but password is wrong
-    existing = database.get_user_by_email(body.email)
     if existing:
         return JSONResponse(status_code=401, content={"error": "Incorrect password. Please try again."})
     return JSONResponse(status_code=404, content={"error": "User not found. Please sign up first."})
 
+SEARCH_LIMIT_MAX = 50
+
+@app.get("/api/search")
+def search(q: str, types: Optional[str] = None, limit: int = 10):
+    type_list = [t.strip() for t in types.split(",")] if types else None
+    return database.search(q, type_list, max(1, min(limit, SEARCH_LIMIT_MAX)))
+
+class TelemetryReading(BaseModel):
+    vehicle_id: int
+    recorded_at: datetime
+    odometer: Optional[float] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    fuel_level: Optional[float] = None
+
+class TelemetryBatch(BaseModel):
+    readings: List[TelemetryReading]
+
+@app.post("/api/telemetry")
+def ingest_telemetry(body: TelemetryBatch, request: Request):
+    if len(body.readings) > telemetry.MAX_BATCH_SIZE:
+        return JSONResponse(status_code=413, content={"error": f"Batch size exceeds {telemetry.MAX_BATCH_SIZE} readings"})
+    counts = telemetry.ingest([r.dict() for r in body.readings])
+    # One summary entry per batch; individual readings are their own record
+    audit.log.record("ingest", "telemetry", None, None,
+                     dict(counts, received=len(body.readings)), _actor(request))
+    return {"success": True, **counts}
+
+@app.get("/api/vehicles/{vehicle_db_id}/telemetry")
+def get_vehicle_telemetry(vehicle_db_id: int, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None, max_points: int = 500):
+    end = telemetry.to_naive_utc(end) if end else datetime.utcnow()
+    start = start and telemetry.to_naive_utc(start)
+    start = start or end - timedelta(days=1)
+    if start >= end:
+        return JSONResponse(status_code=400, content={"error": "start must be before end"})
+    return telemetry.query(vehicle_db_id, start, end, max(1, min(max_points, 5000)))
+
+@app.get("/api/analytics/lanes")
+def get_lane_analytics(start: Optional[date] = None, end: Optional[date] = None,
+                       limit: int = 10, sort: str = "trips"):
+    if sort not in lanes.SORT_COLUMNS:
+        return JSONResponse(status_code=400, content={"error": f"sort must be one of: {', '.join(lanes.SORT_COLUMNS)}"})
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        return JSONResponse(status_code=400, content={"error": "start must not be after end"})
+    # Read-only: job workers fold trip writes in every LANES_REFRESH_SECONDS (see jobs.py)
+    return {"start": start, "end": end, "sort": sort, "lanes": lanes.top_lanes(start, end, limit, sort)}
+
+class TripComplete(BaseModel):
+    end_odometer: float = Field(ge=0)
+
+@app.post("/api/trips/{trip_id}/complete")
+def complete_trip(trip_id: int, body: TripComplete, request: Request):
+    try:
+        before, trip, vehicle_change = database.complete_trip(trip_id, body.end_odometer)
+    except ValueError as exc:
+        return JSONResponse(status_code=400, content={"error": str(exc)})
+    if not trip:
+        return JSONResponse(status_code=404, content={"error": "Dispatched trip not found"})
+    actor = _actor(request)
+    audit.log.record("complete", "trip", trip_id, before, trip, actor)
+    if vehicle_change:
+        audit.log.record("update_odometer", "vehicle", trip["vehicle_id"], *vehicle_change, actor)
+    maintenance_scheduler.on_trip_completed(trip["vehicle_id"])
+    return {"success": True, "trip": trip}
+
+class MaintenanceCreate(BaseModel):
+    description: str
+    cost: float = Field(ge=0)
+    service_date: Optional[date] = None
+
+@app.post("/api/vehicles/{vehicle_db_id}/maintenance")
+def log_vehicle_maintenance(vehicle_db_id: int, body: MaintenanceCreate, request: Request):
+    log = database.log_maintenance(vehicle_db_id, body.description, body.cost, body.service_date)
+    if not log:
+        return JSONResponse(status_code=404, content={"error": "Vehicle not found"})
+    audit.log.record("create", "maintenance_log", log["id"], None, log, _actor(request))
+    maintenance_scheduler.on_service_logged(vehicle_db_id)
+    return {"success": True, "maintenance": log}
+
+@app.get("/api/maintenance/upcoming")
+def get_upcoming_maintenance(limit: int = 20):
+    return maintenance_scheduler.upcoming(limit)
+
+@app.get("/api/health/replicas")
+def get_replica_health():
+    return database.replica_status()
+
+JOB_MAX_ATTEMPTS_MAX = 20
+
+class JobCreate(BaseModel):
+    kind: str
+    payload: dict = {}
+    max_attempts: int = Field(default=5, ge=1, le=JOB_MAX_ATTEMPTS_MAX)
+
+@app.post("/api/jobs", status_code=202)
+def create_job(body: JobCreate, request: Request):
+    if body.kind not in jobs.HANDLERS:
+        return JSONResponse(status_code=400, content={"error": f"Unknown job kind: {body.kind}"})
+    job = jobs.enqueue(body.kind, body.payload, body.max_attempts)
+    audit.log.record("create", "job", job["id"], None,
+                     {"kind": body.kind, "payload": body.payload}, _actor(request))
+    return {"success": True, "job_id": job["id"]}
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: int):
+    job = jobs.get_job(job_id)
+    if job:
+        return job
+    return JSONResponse(status_code=404, content={"error": "Job not found"})
+
+@app.get("/api/audit")
+def get_audit_log(entity: Optional[str] = None, entity_id: Optional[str] = None,
+                  actor: Optional[str] = None, cursor: Optional[int] = None, limit: int = 50):
+    return audit.query(entity, entity_id, actor, cursor, limit)
+
 # ---------------------------------------------------------------------------
 # Page Route
 # ---------------------------------------------------------------------------
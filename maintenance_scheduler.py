@@ -0,0 +1,212 @@
+"""
+FleetFlow - Predictive Maintenance Scheduler
+Estimates when each vehicle is next due for service and moves it to 'In Shop'.
+
+A vehicle is due when it has either driven its service interval since the last
+maintenance log, or gone ``MAX_DAYS_BETWEEN_SERVICE`` without one. The driving
+rate comes from completed trips (end_odometer - start_odometer) over a trailing
+window, so the distance-based due date is projected forward from today.
+Logging a service (``database.log_maintenance``) moves the vehicle back to
+'Available'; vehicles on a trip when they fall due go in once they return.
+
+Upcoming services live in a min-heap keyed by due date. Updating a vehicle
+pushes a fresh entry and bumps its version; stale heap entries are discarded
+lazily when popped, so a single vehicle update is O(log n) and never rescans
+the fleet. Changes made outside this process (services logged elsewhere,
+vehicles retired by hand) are picked up by a full reconcile every
+``RECONCILE_SECONDS``.
+"""
+import heapq
+import threading
+import time
+from datetime import date, timedelta
+
+import database
+
+# Distance between services, in odometer units, per vehicle type
+SERVICE_INTERVAL_KM = {
+    "Truck": 25000,
+    "Van": 15000,
+    "Bike": 5000,
+}
+DEFAULT_SERVICE_INTERVAL_KM = 20000
+MAX_DAYS_BETWEEN_SERVICE = 180
+RATE_WINDOW_DAYS = 90
+
+# How far ahead of the due date a vehicle is pulled into the shop
+LEAD_DAYS = 0
+TICK_SECONDS = 60
+RECONCILE_SECONDS = 3600
+FLIP_BATCH_SIZE = 1000
+
+
+def compute_due_date(vehicle_type, last_service, km_since_service, km_per_day, today=None):
+    """Return the date a vehicle is next due for service."""
+    today = today or date.today()
+    interval = SERVICE_INTERVAL_KM.get(vehicle_type, DEFAULT_SERVICE_INTERVAL_KM)
+    by_calendar = last_service + timedelta(days=MAX_DAYS_BETWEEN_SERVICE)
+
+    remaining = interval - float(km_since_service)
+    if remaining <= 0:
+        return min(today, by_calendar)
+    if km_per_day <= 0:
+        return by_calendar
+    # Cap the projection; the calendar limit always wins beyond it anyway
+    days_left = min(remaining / km_per_day, MAX_DAYS_BETWEEN_SERVICE)
+    by_distance = today + timedelta(days=int(days_left))
+    return min(by_distance, by_calendar)
+
+
+class MaintenanceScheduler:
+    """Min-heap of upcoming services with incremental, batched refreshes."""
+
+    def __init__(self, tick_seconds: int = TICK_SECONDS, reconcile_seconds: int = RECONCILE_SECONDS):
+        self.tick_seconds = tick_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self._heap = []        # (due_date, version, vehicle_id)
+        self._versions = {}    # vehicle_id -> latest version
+        self._due = {}         # vehicle_id -> current due date
+        self._dirty = set()    # vehicles awaiting a stats refresh
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -- heap maintenance ---------------------------------------------------
+
+    def upsert(self, vehicle_id, due_date):
+        """Set (or replace) the due date for one vehicle."""
+        with self._lock:
+            version = self._versions.get(vehicle_id, 0) + 1
+            self._versions[vehicle_id] = version
+            self._due[vehicle_id] = due_date
+            heapq.heappush(self._heap, (due_date, version, vehicle_id))
+            if len(self._heap) > 2 * len(self._due) + 1024:
+                self._compact()
+
+    def _compact(self):
+        """Drop stale heap entries once they outnumber live ones. Caller holds the lock."""
+        self._heap = [(d, self._versions[vid], vid) for vid, d in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def remove(self, vehicle_id):
+        """Stop tracking a vehicle; its heap entries become stale."""
+        with self._lock:
+            self._versions[vehicle_id] = self._versions.get(vehicle_id, 0) + 1
+            self._due.pop(vehicle_id, None)
+
+    def pop_due(self, today=None):
+        """Pop every vehicle due on or before today + LEAD_DAYS. Returns (vehicle_id, due_date) pairs."""
+        cutoff = (today or date.today()) + timedelta(days=LEAD_DAYS)
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= cutoff:
+                due_date, version, vehicle_id = heapq.heappop(self._heap)
+                if self._versions.get(vehicle_id) != version:
+                    continue
+                self._due.pop(vehicle_id, None)
+                due.append((vehicle_id, due_date))
+        return due
+
+    def upcoming(self, limit: int = 20):
+        """Return the next ``limit`` services as a list of dicts, soonest first."""
+        with self._lock:
+            items = heapq.nsmallest(limit, self._due.items(), key=lambda kv: kv[1])
+        return [{"vehicle_id": vid, "due_date": d.isoformat()} for vid, d in items]
+
+    def __len__(self):
+        return len(self._due)
+
+    # -- database sync -------------------------------------------------------
+
+    def apply_stats(self, rows, today=None):
+        """Recompute due dates from rows returned by database.get_vehicle_service_stats."""
+        seen = set()
+        for r in rows:
+            km_per_day = float(r["km_recent"]) / RATE_WINDOW_DAYS
+            due_date = compute_due_date(r["vehicle_type"], r["last_service"],
+                                        r["km_since_service"], km_per_day, today)
+            self.upsert(r["vehicle_id"], due_date)
+            seen.add(r["vehicle_id"])
+        return seen
+
+    def load_all(self):
+        """Full fleet load: recompute every vehicle and drop ones no longer in service.
+
+        Used at startup and as the periodic reconcile.
+        """
+        seen = self.apply_stats(database.get_vehicle_service_stats(rate_window_days=RATE_WINDOW_DAYS))
+        with self._lock:
+            gone = set(self._due) - seen
+        for vehicle_id in gone:
+            self.remove(vehicle_id)
+
+    def on_trip_completed(self, vehicle_id):
+        """Queue a vehicle for refresh after one of its trips completes."""
+        with self._lock:
+            self._dirty.add(vehicle_id)
+
+    # A new maintenance log resets the service clock the same way
+    on_service_logged = on_trip_completed
+
+    def refresh_dirty(self):
+        """Reload stats for only the vehicles touched since the last tick."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        # Read from the primary: the trip that triggered this was just committed there
+        seen = self.apply_stats(database.get_vehicle_service_stats(dirty, RATE_WINDOW_DAYS, primary=True))
+        # Vehicles missing from the result were retired or deleted
+        for vehicle_id in dirty - seen:
+            self.remove(vehicle_id)
+
+    def flip_due(self, today=None):
+        """Move due vehicles to 'In Shop' in batched updates. Returns the ids that changed."""
+        due = self.pop_due(today)
+        changed = []
+        for i in range(0, len(due), FLIP_BATCH_SIZE):
+            batch = due[i:i + FLIP_BATCH_SIZE]
+            flipped, on_trip = database.mark_vehicles_in_shop([vid for vid, _ in batch])
+            changed.extend(flipped)
+            # Vehicles on a trip stay scheduled and are retried next tick, so they
+            # go to the shop when they get back. Ones already in the shop wait for
+            # a logged service to reschedule them.
+            on_trip = set(on_trip)
+            for vehicle_id, due_date in batch:
+                if vehicle_id in on_trip:
+                    self.upsert(vehicle_id, due_date)
+        return changed
+
+    def tick(self):
+        self.refresh_dirty()
+        return self.flip_due()
+
+    # -- background thread ---------------------------------------------------
+
+    def _run(self):
+        reconciled_at = None
+        while True:
+            try:
+                if reconciled_at is None or time.monotonic() - reconciled_at >= self.reconcile_seconds:
+                    self.load_all()
+                    reconciled_at = time.monotonic()
+                self.tick()
+            except Exception as exc:
+                print(f"Maintenance scheduler: tick failed: {exc}")
+            if self._stop.wait(self.tick_seconds):
+                return
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="maintenance-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+scheduler = MaintenanceScheduler()
@@ -0,0 +1,258 @@
+"""
+FleetFlow - Login Throttling
+Token-bucket rate limits and a concurrency cap for password checks.
+
+``LoginThrottle`` keeps two buckets per attempt, one keyed by client IP and
+one by the (normalised) email, so a single source cannot spray many accounts
+and many sources cannot hammer one account. Buckets live in a backend:
+
+  * ``MemoryBackend`` (default) - per process, bounded LRU of buckets.
+  * ``PostgresBackend`` - one UNLOGGED table shared by every worker and
+    service pointed at it; set ``RATE_LIMIT_BACKEND_URL`` to a Postgres DSN.
+    Callers wait up to ``POOL_WAIT_SECONDS`` for a pooled connection; if
+    all stay busy the attempt is refused with a short retry-after. If the
+    shared store is unreachable, it falls back to a local bucket rather
+    than locking everyone out.
+
+``AdmissionGate`` caps how many password verifications run at once. A
+request that cannot get a slot within ``wait`` seconds is refused (the
+caller answers 429) instead of queueing behind an attack.
+
+Both the main app and the auth service in ``user_authentication/`` use this
+module.
+"""
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+RATE_LIMIT_BACKEND_URL = os.getenv("RATE_LIMIT_BACKEND_URL", "")
+
+# (burst, tokens refilled per second)
+LOGIN_PER_IP = (20, 20 / 60)          # 20 at once, then one every 3 s
+LOGIN_PER_EMAIL = (10, 10 / 300)      # 10 at once, then one every 30 s
+
+MEMORY_MAX_KEYS = 100000
+
+POOL_WAIT_SECONDS = 0.5
+# The "using local buckets" warning is printed at most this often
+FALLBACK_LOG_SECONDS = 30
+
+
+class Overloaded(Exception):
+    """Raised by AdmissionGate when no verification slot frees up in time."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many concurrent logins; retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class MemoryBackend:
+    """Token buckets in a dict, evicting the least recently used past ``max_keys``.
+
+    An evicted bucket comes back full, which is also what an idle bucket would
+    have refilled to, so eviction only loosens limits for keys nobody is using.
+    """
+
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()   # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1, now: float = None):
+        """Spend ``cost`` tokens from ``key``. Returns 0 if allowed, else seconds until it would be."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+_PG_REFILL = ("LEAST(%(capacity)s, b.tokens + "
+              "EXTRACT(EPOCH FROM now() - b.updated_at)::float8 * %(rate)s::float8)")
+
+_PG_TAKE_SQL = f"""
+    INSERT INTO rate_limit_buckets AS b (key, tokens, allowed, updated_at)
+    VALUES (%(key)s, %(capacity)s - %(cost)s, TRUE, now())
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = CASE WHEN {_PG_REFILL} >= %(cost)s THEN {_PG_REFILL} - %(cost)s ELSE {_PG_REFILL} END,
+        allowed = {_PG_REFILL} >= %(cost)s,
+        updated_at = now()
+    RETURNING tokens, allowed
+"""
+
+
+class PostgresBackend:
+    """Token buckets in a shared Postgres table, one atomic upsert per take.
+
+    Rows idle long enough to have refilled completely are equivalent to no
+    row, so every ``sweep_every`` calls one caller deletes them.
+    """
+
+    def __init__(self, dsn: str, max_connections: int = 8, sweep_every: int = 1000,
+                 pool_wait: float = POOL_WAIT_SECONDS):
+        import psycopg2.pool
+
+        # putconn closes any connection beyond minconn, so keep the whole pool open
+        self._pool = psycopg2.pool.ThreadedConnectionPool(max_connections, max_connections, dsn,
+                                                          connect_timeout=2)
+        # getconn raises at once when every connection is out; queue for one instead
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._pool_wait = pool_wait
+        self._fallback = MemoryBackend()
+        self._sweep_every = sweep_every
+        self._longest_refill = 0.0
+        self._log_lock = threading.Lock()
+        self._logged_at = float("-inf")
+        self._suppressed = 0
+        self._init_table()
+
+    def _init_table(self):
+        conn = self._pool.getconn()
+        try:
+            conn.autocommit = True
+            conn.cursor().execute("""
+                CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens DOUBLE PRECISION NOT NULL,
+                    allowed BOOLEAN NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL
+                )
+            """)
+        finally:
+            self._pool.putconn(conn)
+
+    def _log_fallback(self, message: str):
+        now = time.monotonic()
+        with self._log_lock:
+            if now - self._logged_at < FALLBACK_LOG_SECONDS:
+                self._suppressed += 1
+                return
+            suppressed, self._suppressed, self._logged_at = self._suppressed, 0, now
+        more = f" ({suppressed} more since the last report)" if suppressed else ""
+        print(f"Rate limit: {message}{more}")
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1, now: float = None):
+        self._longest_refill = max(self._longest_refill, capacity / rate)
+        if not self._slots.acquire(timeout=self._pool_wait):
+            # The store is up but every connection is busy: a burst, so shed it
+            return max(1.0, self._pool_wait)
+        try:
+            return self._take(key, capacity, rate, cost, now)
+        finally:
+            self._slots.release()
+
+    def _take(self, key, capacity, rate, cost, now):
+        import psycopg2
+
+        try:
+            conn = self._pool.getconn()
+        except psycopg2.Error as exc:
+            self._log_fallback(f"shared backend unavailable, using local buckets: {exc}")
+            return self._fallback.take(key, capacity, rate, cost, now)
+        broken = False
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(_PG_TAKE_SQL, {"key": key, "capacity": capacity, "rate": rate, "cost": cost})
+            tokens, allowed = cursor.fetchone()
+            if random.randrange(self._sweep_every) == 0:
+                cursor.execute(
+                    "DELETE FROM rate_limit_buckets WHERE updated_at < now() - %s * interval '1 second'",
+                    (self._longest_refill,),
+                )
+        except psycopg2.Error as exc:
+            broken = conn.closed != 0
+            self._log_fallback(f"shared backend error, using local buckets: {exc}")
+            return self._fallback.take(key, capacity, rate, cost, now)
+        finally:
+            self._pool.putconn(conn, close=broken)
+        return 0.0 if allowed else (cost - tokens) / rate
+
+
+def backend_from_env():
+    """Shared Postgres buckets if RATE_LIMIT_BACKEND_URL is set, else in-process ones."""
+    if RATE_LIMIT_BACKEND_URL:
+        try:
+            return PostgresBackend(RATE_LIMIT_BACKEND_URL)
+        except Exception as exc:
+            print(f"Rate limit: shared backend unavailable at startup, using local buckets: {exc}")
+    return MemoryBackend()
+
+
+# ---------------------------------------------------------------------------
+# Login Throttle & Admission Gate
+# ---------------------------------------------------------------------------
+
+class LoginThrottle:
+    """Per-IP and per-email token buckets for login attempts.
+
+    ``name`` prefixes every key so services sharing a backend keep separate
+    buckets. Pass ``enabled=False`` to let everything through (benchmarks).
+    """
+
+    def __init__(self, name: str, backend=None, per_ip=LOGIN_PER_IP, per_email=LOGIN_PER_EMAIL,
+                 enabled: bool = True):
+        self.name = name
+        self.backend = backend or MemoryBackend()
+        self.per_ip = per_ip
+        self.per_email = per_email
+        self.enabled = enabled
+
+    def check(self, ip: str, email: str):
+        """Charge one attempt. Returns 0 if allowed, else seconds the client should wait."""
+        if not self.enabled:
+            return 0.0
+        retry_after = self.backend.take(f"{self.name}:ip:{ip}", *self.per_ip)
+        if retry_after:
+            return retry_after
+        email = (email or "").strip().lower()
+        return self.backend.take(f"{self.name}:email:{email}", *self.per_email)
+
+
+class AdmissionGate:
+    """Limit concurrent password verifications; shed the excess.
+
+        with gate:
+            ok = verify(password, stored_hash)
+
+    raises ``Overloaded`` if no slot frees up within ``wait`` seconds.
+    """
+
+    def __init__(self, limit: int, wait: float = 0.1):
+        self.limit = limit
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def __enter__(self):
+        if not self._slots.acquire(timeout=self.wait):
+            raise Overloaded(max(1.0, self.wait))
+        return self
+
+    def __exit__(self, *exc):
+        self._slots.release()
+        return False
+
+
+def retry_after_header(seconds: float):
+    """Retry-After wants whole seconds; never tell a client to retry immediately."""
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
@@ -0,0 +1,386 @@
+"""
+FleetFlow - Scale Data Generator
+Fills the Postgres database with synthetic, referentially consistent data for
+performance work.
+
+    python seed_scale.py --vehicles 5000 --drivers 5000 --trips 2000000 \\
+        --maintenance 500000 --workers 8 --seed 42 --end-date 2026-01-01 --password 'choose-one'
+
+Rows are generated in chunks by a pool of worker processes and streamed into
+Postgres with COPY, one connection per worker. Every chunk draws from its own
+RNG seeded by (seed, table, chunk index), so the output depends only on the
+arguments and not on worker count or scheduling. Pass --end-date to pin the
+date range too; it defaults to today.
+
+Users, vehicles, drivers and trips get explicit ids above the current maximum
+so trips, fuel logs and revenue can reference them without a round trip; the
+SERIAL sequences are moved past the new ids at the end. Fuel logs and revenue
+are generated alongside the trip they belong to. Lanes for every city pair
+are created up front and trips carry their lane id, so the per-row lane
+trigger is skipped; lane aggregates are refreshed once after the load.
+
+Chunks cannot see each other, so trips are made to agree with their vehicles
+and drivers after the load (see ``_settle_trips``): odometers run on from the
+vehicle's, and every vehicle and driver left 'On Trip' has a Dispatched trip.
+
+Users get the plaintext --password, which is required: the app lets an
+empty stored password sign in with anything.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import psycopg2.extras
+
+import database
+import lanes
+
+CITIES = [
+    "Chicago, IL", "Detroit, MI", "Indianapolis, IN", "Columbus, OH", "Milwaukee, WI",
+    "St. Louis, MO", "Kansas City, MO", "Minneapolis, MN", "Dallas, TX", "Houston, TX",
+    "Austin, TX", "Atlanta, GA", "Nashville, TN", "Memphis, TN", "Denver, CO",
+    "Phoenix, AZ", "Los Angeles, CA", "Oakland, CA", "Seattle, WA", "Portland, OR",
+    "New York, NY", "Newark, NJ", "Philadelphia, PA", "Pittsburgh, PA", "Boston, MA",
+    "Charlotte, NC", "Jacksonville, FL", "Miami, FL", "Salt Lake City, UT", "Omaha, NE",
+]
+MAKES = {
+    "Truck": [("Volvo", "VNL 860"), ("Freightliner", "Cascadia"), ("Kenworth", "T680"), ("Peterbilt", "579")],
+    "Van": [("Ford", "Transit"), ("Mercedes-Benz", "Sprinter"), ("Ram", "ProMaster")],
+    "Bike": [("Honda", "CB500X"), ("Yamaha", "Tracer 7")],
+}
+VEHICLE_TYPES = [("Truck", 0.6), ("Van", 0.35), ("Bike", 0.05)]
+CAPACITY = {"Truck": 12000, "Van": 3000, "Bike": 150}
+VEHICLE_STATUSES = [("Available", 0.55), ("On Trip", 0.25), ("In Shop", 0.1), ("Active", 0.08), ("Retired", 0.02)]
+DRIVER_STATUSES = [("On Duty", 0.6), ("Off Duty", 0.25), ("On Trip", 0.12), ("Suspended", 0.03)]
+# Dispatched trips are added by _settle_trips, one per vehicle/driver pair 'On Trip'
+TRIP_STATUSES = [("Completed", 0.88), ("Cancelled", 0.08), ("Draft", 0.04)]
+ROLES = [("dispatcher", 0.5), ("safety", 0.15), ("finance", 0.15), ("manager", 0.2)]
+FIRST_NAMES = ["James", "Maria", "Robert", "Linda", "Michael", "Aisha", "Wei", "Priya", "Carlos", "Fatima",
+               "David", "Sofia", "Daniel", "Yuki", "Omar", "Elena", "Kwame", "Anna", "Luis", "Grace"]
+LAST_NAMES = ["Smith", "Garcia", "Johnson", "Nguyen", "Patel", "Kim", "Brown", "Lopez", "Okafor", "Müller",
+              "Rossi", "Khan", "Silva", "Cohen", "Ivanov", "Tanaka", "Moore", "Clark", "Hernandez", "Ali"]
+MAINTENANCE_ITEMS = [("Oil change", 80, 250), ("Brake pads", 300, 900), ("Tire rotation", 60, 150),
+                     ("Transmission service", 900, 3500), ("DPF cleaning", 400, 1200), ("Annual inspection", 150, 400)]
+
+COLUMNS = {
+    "users": ["id", "name", "email", "password_hash", "role", "status", "avatar", "created_at"],
+    "vehicles": ["id", "name", "vehicle_id", "make", "model", "year", "license_plate", "vehicle_type",
+                 "vehicle_class", "max_capacity", "odometer", "acquisition_cost", "status", "vin", "created_at"],
+    "drivers": ["id", "name", "license_number", "license_category", "license_expiry_date", "status",
+                "safety_score", "created_at"],
+    "trips": ["id", "vehicle_id", "driver_id", "cargo_weight", "origin", "destination", "status",
+              "start_odometer", "end_odometer", "created_at", "completed_at", "lane_id"],
+    "fuel_logs": ["vehicle_id", "trip_id", "liters", "cost", "date"],
+    "trip_revenue": ["trip_id", "revenue_amount"],
+    "maintenance_logs": ["vehicle_id", "description", "cost", "service_date"],
+}
+
+
+def _weighted(rng, choices):
+    r = rng.random()
+    for value, weight in choices:
+        r -= weight
+        if r <= 0:
+            return value
+    return choices[-1][0]
+
+
+def _timestamp(rng, end: datetime, days: int):
+    return end - timedelta(seconds=rng.randint(0, days * 86400))
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+# ---------------------------------------------------------------------------
+# Row generators: each yields CSV rows for one chunk of ids
+# ---------------------------------------------------------------------------
+
+def gen_users(rng, ids, ctx):
+    for i in ids:
+        yield [i, _name(rng), f"user{i}@scale.fleetflow.com", ctx["password"], _weighted(rng, ROLES),
+               "active" if rng.random() < 0.9 else "inactive", f"https://i.pravatar.cc/150?img={i % 70}",
+               _timestamp(rng, ctx["end"], ctx["days"])]
+
+
+def gen_vehicles(rng, ids, ctx):
+    for i in ids:
+        vtype = _weighted(rng, VEHICLE_TYPES)
+        make, model = rng.choice(MAKES[vtype])
+        vin = "".join(rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ0123456789") for _ in range(17))
+        yield [i, f"{make} {model}", f"VEH-{i:07d}", make, model, rng.randint(2012, 2025),
+               f"FF-{i:07d}", vtype, "Class 8" if vtype == "Truck" else "Class 2",
+               CAPACITY[vtype], round(rng.uniform(1000, 400000), 2), round(rng.uniform(20000, 180000), 2),
+               _weighted(rng, VEHICLE_STATUSES), vin, _timestamp(rng, ctx["end"], ctx["days"] + 365)]
+
+
+def gen_drivers(rng, ids, ctx):
+    for i in ids:
+        yield [i, _name(rng), f"DL-{i:08d}", rng.choice(["CDL-A", "CDL-B", "C"]),
+               ctx["end"].date() + timedelta(days=rng.randint(-60, 1500)), _weighted(rng, DRIVER_STATUSES),
+               round(rng.uniform(60, 100), 2), _timestamp(rng, ctx["end"], ctx["days"] + 365)]
+
+
+def gen_maintenance(rng, ids, ctx):
+    for _ in ids:
+        desc, low, high = rng.choice(MAINTENANCE_ITEMS)
+        yield [rng.randint(ctx["vehicle_lo"], ctx["vehicle_hi"]), desc, round(rng.uniform(low, high), 2),
+               _timestamp(rng, ctx["end"], ctx["days"]).date()]
+
+
+def gen_trips(rng, ids, ctx):
+    """Yields (table, row) pairs: each trip plus its fuel logs and revenue."""
+    for i in ids:
+        vehicle_id = rng.randint(ctx["vehicle_lo"], ctx["vehicle_hi"])
+        origin, destination = rng.sample(CITIES, 2)
+        status = _weighted(rng, TRIP_STATUSES)
+        created = _timestamp(rng, ctx["end"], ctx["days"])
+        start_odo = end_odo = completed = None
+        if status == "Completed":
+            # Placeholder readings; _settle_trips chains them onto the vehicle odometer
+            distance = rng.uniform(40, 2500)
+            start_odo = 0
+            end_odo = round(distance, 2)
+            completed = created + timedelta(hours=distance / rng.uniform(45, 75))
+        yield "trips", [i, vehicle_id, rng.randint(ctx["driver_lo"], ctx["driver_hi"]),
+                        round(rng.uniform(100, 12000), 2), origin, destination, status,
+                        start_odo, end_odo, created, completed, ctx["lanes"][origin, destination]]
+        if status != "Completed":
+            continue
+        yield "trip_revenue", [i, round(distance * rng.uniform(1.8, 3.2), 2)]
+        # Poisson-ish number of fill-ups per trip around the requested mean
+        fills = int(ctx["fuel_per_trip"]) + (rng.random() < ctx["fuel_per_trip"] % 1)
+        for _ in range(fills):
+            liters = round(rng.uniform(40, 400), 2)
+            yield "fuel_logs", [vehicle_id, i, liters, round(liters * rng.uniform(1.1, 1.6), 2), completed.date()]
+
+
+GENERATORS = {
+    "users": gen_users,
+    "vehicles": gen_vehicles,
+    "drivers": gen_drivers,
+    "maintenance_logs": gen_maintenance,
+    "trips": gen_trips,
+}
+
+
+def _copy(cursor, table, rows_buf):
+    rows_buf.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(COLUMNS[table])}) FROM STDIN WITH (FORMAT csv)", rows_buf)
+
+
+def load_chunk(task):
+    """Generate one chunk and COPY it in. Runs in a worker process."""
+    table, chunk_index, first_id, count, ctx = task
+    rng = random.Random(f"{ctx['seed']}:{table}:{chunk_index}")
+    ids = range(first_id, first_id + count)
+
+    buffers = {}
+    writers = {}
+    rows = GENERATORS[table](rng, ids, ctx)
+    if table != "trips":
+        rows = ((table, r) for r in rows)
+    for target, row in rows:
+        if target not in writers:
+            buffers[target] = io.StringIO()
+            writers[target] = csv.writer(buffers[target])
+        writers[target].writerow(row)
+
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    # Parents before children within the chunk
+    for target in ("trips", "trip_revenue", "fuel_logs"):
+        if target in buffers:
+            _copy(cursor, target, buffers.pop(target))
+    for target, buf in buffers.items():
+        _copy(cursor, target, buf)
+    conn.commit()
+    conn.close()
+    return table, count
+
+
+def _next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def _ensure_lanes(cursor):
+    """Create a lane for every ordered city pair; returns {(origin, destination): lane id}."""
+    pairs = [(o, d) for o in CITIES for d in CITIES if o != d]
+    psycopg2.extras.execute_values(
+        cursor,
+        """INSERT INTO lanes (origin, destination, origin_key, destination_key)
+           SELECT o, d, lane_key(o), lane_key(d) FROM (VALUES %s) v (o, d)
+           ON CONFLICT DO NOTHING""",
+        pairs, page_size=len(pairs),
+    )
+    rows = psycopg2.extras.execute_values(
+        cursor,
+        """SELECT v.o, v.d, l.id FROM (VALUES %s) v (o, d)
+           JOIN lanes l ON l.origin_key = lane_key(v.o) AND l.destination_key = lane_key(v.d)""",
+        pairs, page_size=len(pairs), fetch=True,
+    )
+    return {(o, d): lane_id for o, d, lane_id in rows}
+
+
+def _settle_trips(cursor, ctx):
+    """Make the new trips agree with their vehicles and drivers.
+
+    Completed trips are laid end to end per vehicle, in creation order,
+    starting from the generated odometer, which then moves to the last
+    trip's end as ``complete_trip`` would have left it. New vehicles and
+    drivers 'On Trip' are paired off in id order and each pair gets one
+    Dispatched trip starting at the vehicle's odometer; the unpaired ones
+    go back to Available / On Duty.
+    """
+    cursor.execute("""
+        WITH legs AS (
+            SELECT t.id, v.odometer AS base, t.end_odometer - t.start_odometer AS distance,
+                   SUM(t.end_odometer - t.start_odometer)
+                       OVER (PARTITION BY t.vehicle_id ORDER BY t.created_at, t.id) AS travelled
+            FROM trips t JOIN vehicles v ON v.id = t.vehicle_id
+            WHERE t.status = 'Completed' AND t.vehicle_id BETWEEN %(vehicle_lo)s AND %(vehicle_hi)s
+        )
+        UPDATE trips t SET start_odometer = legs.base + legs.travelled - legs.distance,
+                           end_odometer = legs.base + legs.travelled
+        FROM legs WHERE t.id = legs.id
+    """, ctx)
+    cursor.execute("""
+        UPDATE vehicles v SET odometer = last.end_odometer
+        FROM (
+            SELECT DISTINCT ON (vehicle_id) vehicle_id, end_odometer FROM trips
+            WHERE status = 'Completed' AND vehicle_id BETWEEN %(vehicle_lo)s AND %(vehicle_hi)s
+            ORDER BY vehicle_id, created_at DESC, id DESC
+        ) last
+        WHERE v.id = last.vehicle_id
+    """, ctx)
+
+    cursor.execute("""
+        SELECT v.id, v.odometer, v.max_capacity, d.id, GREATEST(vl.last, dl.last)
+        FROM (SELECT id, odometer, max_capacity, row_number() OVER (ORDER BY id) AS n FROM vehicles
+              WHERE status = 'On Trip' AND id BETWEEN %(vehicle_lo)s AND %(vehicle_hi)s) v
+        JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM drivers
+              WHERE status = 'On Trip' AND id BETWEEN %(driver_lo)s AND %(driver_hi)s) d USING (n)
+        LEFT JOIN (SELECT vehicle_id, MAX(completed_at) AS last FROM trips
+                   WHERE vehicle_id BETWEEN %(vehicle_lo)s AND %(vehicle_hi)s GROUP BY vehicle_id) vl
+               ON vl.vehicle_id = v.id
+        LEFT JOIN (SELECT driver_id, MAX(completed_at) AS last FROM trips
+                   WHERE driver_id BETWEEN %(driver_lo)s AND %(driver_hi)s GROUP BY driver_id) dl
+               ON dl.driver_id = d.id
+        ORDER BY v.id
+    """, ctx)
+    rng = random.Random(f"{ctx['seed']}:dispatched")
+    rows = []
+    for vehicle_id, odometer, capacity, driver_id, last_completed in cursor.fetchall():
+        origin, destination = rng.sample(CITIES, 2)
+        created = ctx["end"] - timedelta(hours=rng.uniform(1, 48))
+        if last_completed and last_completed > created:
+            created = last_completed + timedelta(minutes=rng.uniform(10, 120))
+        rows.append((vehicle_id, driver_id, round(rng.uniform(0.1, 1) * float(capacity), 2), origin, destination,
+                     "Dispatched", odometer, created, ctx["lanes"][origin, destination]))
+    psycopg2.extras.execute_values(
+        cursor,
+        """INSERT INTO trips (vehicle_id, driver_id, cargo_weight, origin, destination, status,
+                              start_odometer, created_at, lane_id) VALUES %s""",
+        rows, page_size=5000,
+    )
+    cursor.execute("""
+        UPDATE vehicles SET status = 'Available'
+        WHERE status = 'On Trip' AND id BETWEEN %(vehicle_lo)s AND %(vehicle_hi)s
+          AND id NOT IN (SELECT vehicle_id FROM trips WHERE status = 'Dispatched')
+    """, ctx)
+    cursor.execute("""
+        UPDATE drivers SET status = 'On Duty'
+        WHERE status = 'On Trip' AND id BETWEEN %(driver_lo)s AND %(driver_hi)s
+          AND id NOT IN (SELECT driver_id FROM trips WHERE status = 'Dispatched')
+    """, ctx)
+    return len(rows)
+
+
+def _tasks(table, total, first_id, chunk_size, ctx):
+    return [(table, n, first_id + offset, min(chunk_size, total - offset), ctx)
+            for n, offset in enumerate(range(0, total, chunk_size))]
+
+
+def _run(pool, label, tasks):
+    if not tasks:
+        return
+    start = time.perf_counter()
+    rows = sum(count for _, count in pool.map(load_chunk, tasks))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<18} {rows:>12,} rows  {elapsed:8.1f}s  ({rows / max(elapsed, 1e-9):,.0f}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic FleetFlow data at scale.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--vehicles", type=int, default=5000)
+    parser.add_argument("--drivers", type=int, default=5000)
+    parser.add_argument("--trips", type=int, default=1_000_000)
+    parser.add_argument("--fuel-per-trip", type=float, default=1.5, help="average fuel logs per completed trip")
+    parser.add_argument("--maintenance", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=730, help="history length in days")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--password", required=True, help="password stored for generated users (non-empty)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+    if not args.password:
+        parser.error("--password must not be empty")
+
+    database.init_db()
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    first = {t: _next_id(cursor, t) for t in ("users", "vehicles", "drivers", "trips")}
+    lane_ids = _ensure_lanes(cursor)
+    conn.commit()
+    conn.close()
+
+    ctx = {
+        "seed": args.seed,
+        "end": datetime.combine(args.end_date, datetime.min.time()),
+        "days": args.days,
+        "password": args.password,
+        "fuel_per_trip": args.fuel_per_trip,
+        "vehicle_lo": first["vehicles"],
+        "vehicle_hi": first["vehicles"] + args.vehicles - 1,
+        "driver_lo": first["drivers"],
+        "driver_hi": first["drivers"] + args.drivers - 1,
+        "lanes": lane_ids,
+    }
+    if args.trips and (args.vehicles < 1 or args.drivers < 1):
+        parser.error("--trips needs at least one new vehicle and driver")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        _run(pool, "users+vehicles+drivers",
+             _tasks("users", args.users, first["users"], args.chunk_size, ctx)
+             + _tasks("vehicles", args.vehicles, first["vehicles"], args.chunk_size, ctx)
+             + _tasks("drivers", args.drivers, first["drivers"], args.chunk_size, ctx))
+        _run(pool, "trips+fuel+revenue", _tasks("trips", args.trips, first["trips"], args.chunk_size, ctx))
+        _run(pool, "maintenance_logs", _tasks("maintenance_logs", args.maintenance, 0, args.chunk_size, ctx))
+
+    conn = database.get_connection()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    for table in ("users", "vehicles", "drivers", "trips"):
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+    if args.vehicles and args.drivers:
+        start = time.perf_counter()
+        dispatched = _settle_trips(cursor, ctx)
+        print(f"{'dispatched trips':<18} {dispatched:>12,} rows  {time.perf_counter() - start:8.1f}s")
+    start = time.perf_counter()
+    refreshed = lanes.refresh()
+    print(f"{'lane_daily_stats':<18} {refreshed:>12,} days  {time.perf_counter() - start:8.1f}s")
+    cursor.execute("ANALYZE")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
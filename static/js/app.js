@@ -4,6 +4,14 @@
 
 /* ----- Role Configuration ----- */
 var currentRole = '';
+// Signed-in user's email, sent with changes so the audit log can name who made them
+var currentUserEmail = '';
+
+function apiHeaders(json) {
+    var headers = json ? { 'Content-Type': 'application/json' } : {};
+    if (currentUserEmail) headers['X-User-Email'] = currentUserEmail;
+    return headers;
+}
 
 var roleProfiles = {
     admin: { name: 'System Admin', title: 'Administrator', avatar: 'https://i.pravatar.cc/150?img=11' },
@@ -87,6 +95,7 @@ function login(e) {
 
 function logout() {
     currentRole = '';
+    currentUserEmail = '';
     document.getElementById('view-main').classList.remove('active');
     document.getElementById('view-login').classList.add('active');
 
@@ -405,7 +414,7 @@ function updateUserStats(users) {
 function changeUserRole(userId, newRole) {
     fetch('/api/users/' + userId + '/role', {
         method: 'PUT',
-        headers: { 'Content-Type': 'application/json' },
+        headers: apiHeaders(true),
         body: JSON.stringify({ role: newRole })
     })
         .then(function (res) { return res.json(); })
@@ -415,7 +424,7 @@ function changeUserRole(userId, newRole) {
 
 function deleteUser(userId) {
     if (!confirm('Are you sure you want to remove this user?')) return;
-    fetch('/api/users/' + userId, { method: 'DELETE' })
+    fetch('/api/users/' + userId, { method: 'DELETE', headers: apiHeaders() })
         .then(function () { loadUsers(); })
         .catch(function (err) { console.error('Delete failed:', err); });
 }
@@ -438,7 +447,7 @@ function addUser(e) {
 
     fetch('/api/users', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: apiHeaders(true),
         body: JSON.stringify({ name: name, email: email, role: role })
     })
         .then(function (res) { return res.json(); })
@@ -497,7 +506,7 @@ function renderVehiclesTable(vehicles) {
 
 function deleteVehicle(dbId) {
     if (!confirm('Are you sure you want to remove this vehicle?')) return;
-    fetch('/api/vehicles/' + dbId, { method: 'DELETE' })
+    fetch('/api/vehicles/' + dbId, { method: 'DELETE', headers: apiHeaders() })
         .then(function () { loadVehicles(); })
         .catch(function (err) { console.error('Delete vehicle failed:', err); });
 }
@@ -531,7 +540,7 @@ function registerVehicle(e) {
 
     fetch('/api/vehicles', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: apiHeaders(true),
         body: JSON.stringify(payload)
     })
         .then(function (res) { return res.json(); })
@@ -585,6 +594,7 @@ function loginFromDB(e) {
 
             // Update roleProfiles with actual user data from DB
             if (data.user) {
+                currentUserEmail = data.user.email || email;
                 var r = data.user.role;
                 roleProfiles[r] = {
                     name: data.user.name,
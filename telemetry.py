@@ -0,0 +1,178 @@
+"""
+FleetFlow - Telematics Time-Series Store
+Per-vehicle odometer / location / fuel-level readings with rollups.
+
+Raw readings are append-only rows in ``telemetry_readings`` (BRIN-indexed on
+time), at most one per vehicle and timestamp. Timestamps are stored as naive
+UTC. Each ingested batch is written with a single statement that
+
+  * appends the raw rows, dropping readings for unknown vehicles and ones
+    already stored, so a device re-sending a batch changes nothing (readings
+    older than ``RAW_RETENTION`` are rejected up front: their raw rows may
+    already be pruned, and re-adding them would count them twice in the
+    longer-lived rollups),
+  * folds only the newly stored rows into the 1-minute, 1-hour and 1-day
+    rollup tables with ON CONFLICT merges, so the rollups are always
+    current, and
+  * moves ``vehicles.odometer`` forward once per vehicle in the batch rather
+    than once per reading.
+
+Older fine-grained data is pruned by ``prune`` (the ``telemetry.prune`` job);
+queries pick the finest resolution that still has data for the requested
+range and stays under the requested number of points.
+"""
+from datetime import datetime, timedelta, timezone
+
+import psycopg2.extras
+
+import database
+
+MAX_BATCH_SIZE = 5000
+
+# (name, table, date_trunc unit, bucket width, retention or None for forever)
+RESOLUTIONS = [
+    ("1m", "telemetry_1m", "minute", timedelta(minutes=1), timedelta(days=7)),
+    ("1h", "telemetry_1h", "hour", timedelta(hours=1), timedelta(days=90)),
+    ("1d", "telemetry_1d", "day", timedelta(days=1), None),
+]
+RAW_RETENTION = timedelta(days=30)
+
+
+def _rollup_cte(name: str, table: str, unit: str):
+    return f"""
+    {name} AS (
+        INSERT INTO {table} AS t
+            (vehicle_id, bucket, samples, odometer_min, odometer_max, fuel_level_sum,
+             fuel_level_count, last_at, last_latitude, last_longitude, last_fuel_level)
+        SELECT vehicle_id, date_trunc('{unit}', recorded_at), COUNT(*),
+               MIN(odometer), MAX(odometer),
+               COALESCE(SUM(fuel_level), 0), COUNT(fuel_level),
+               MAX(recorded_at),
+               (array_agg(latitude ORDER BY recorded_at DESC))[1],
+               (array_agg(longitude ORDER BY recorded_at DESC))[1],
+               (array_agg(fuel_level ORDER BY recorded_at DESC))[1]
+        FROM raw
+        GROUP BY 1, 2
+        ON CONFLICT (vehicle_id, bucket) DO UPDATE SET
+            samples = t.samples + EXCLUDED.samples,
+            odometer_min = LEAST(t.odometer_min, EXCLUDED.odometer_min),
+            odometer_max = GREATEST(t.odometer_max, EXCLUDED.odometer_max),
+            fuel_level_sum = t.fuel_level_sum + EXCLUDED.fuel_level_sum,
+            fuel_level_count = t.fuel_level_count + EXCLUDED.fuel_level_count,
+            last_at = GREATEST(t.last_at, EXCLUDED.last_at),
+            last_latitude = CASE WHEN EXCLUDED.last_at >= t.last_at THEN EXCLUDED.last_latitude ELSE t.last_latitude END,
+            last_longitude = CASE WHEN EXCLUDED.last_at >= t.last_at THEN EXCLUDED.last_longitude ELSE t.last_longitude END,
+            last_fuel_level = CASE WHEN EXCLUDED.last_at >= t.last_at THEN EXCLUDED.last_fuel_level ELSE t.last_fuel_level END
+    )"""
+
+
+_INGEST_SQL = f"""
+    WITH incoming (vehicle_id, recorded_at, odometer, latitude, longitude, fuel_level) AS (
+        VALUES %s
+    ),
+    known AS (
+        SELECT i.* FROM incoming i JOIN vehicles v ON v.id = i.vehicle_id
+    ),
+    raw AS (
+        INSERT INTO telemetry_readings (vehicle_id, recorded_at, odometer, latitude, longitude, fuel_level)
+        SELECT * FROM known
+        ON CONFLICT (vehicle_id, recorded_at) DO NOTHING
+        RETURNING vehicle_id, recorded_at, odometer, latitude, longitude, fuel_level
+    ),
+    {",".join(_rollup_cte(f"r_{name}", table, unit) for name, table, unit, _, _ in RESOLUTIONS)},
+    odometer AS (
+        UPDATE vehicles v SET odometer = latest.odometer
+        FROM (SELECT vehicle_id, MAX(odometer) AS odometer FROM raw GROUP BY vehicle_id) latest
+        WHERE v.id = latest.vehicle_id AND latest.odometer > v.odometer
+    )
+    SELECT (SELECT COUNT(*) FROM raw), (SELECT COUNT(*) FROM known)
+"""
+_INGEST_TEMPLATE = "(%s::int, %s::timestamp, %s::numeric, %s::float8, %s::float8, %s::numeric)"
+
+
+def to_naive_utc(ts: datetime):
+    """Naive UTC for storage and comparison; naive input is taken to be UTC already."""
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def _valid(reading, cutoff: datetime):
+    odometer, fuel_level = reading.get("odometer"), reading.get("fuel_level")
+    return (to_naive_utc(reading["recorded_at"]) >= cutoff
+            and (odometer is None or odometer >= 0) and (fuel_level is None or 0 <= fuel_level <= 100))
+
+
+def ingest(readings, now: datetime = None):
+    """Store a batch of reading dicts.
+
+    Returns {'accepted', 'duplicates', 'rejected'}: newly stored readings,
+    readings already stored (a retried batch), and readings with an
+    out-of-range odometer or fuel level, an unknown vehicle, or a timestamp
+    older than ``RAW_RETENTION``.
+    """
+    cutoff = (now or datetime.utcnow()) - RAW_RETENTION
+    rows = [
+        (r["vehicle_id"], to_naive_utc(r["recorded_at"]), r.get("odometer"), r.get("latitude"),
+         r.get("longitude"), r.get("fuel_level"))
+        for r in readings if _valid(r, cutoff)
+    ]
+    accepted = known = 0
+    if rows:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        # page_size covers the whole batch so it runs as one statement
+        accepted, known = psycopg2.extras.execute_values(
+            cursor, _INGEST_SQL, rows, template=_INGEST_TEMPLATE, page_size=len(rows), fetch=True,
+        )[0]
+        conn.commit()
+        conn.close()
+    return {"accepted": accepted, "duplicates": known - accepted, "rejected": len(readings) - known}
+
+
+def pick_resolution(start: datetime, end: datetime, max_points: int, now: datetime = None):
+    """Finest resolution whose retention covers ``start`` and whose bucket count fits ``max_points``."""
+    now = now or datetime.utcnow()
+    for resolution in RESOLUTIONS:
+        _, _, _, width, retention = resolution
+        if retention is not None and start < now - retention:
+            continue
+        if (end - start) / width <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def query(vehicle_id: int, start: datetime, end: datetime, max_points: int = 500):
+    """Return {'resolution', 'points'} for one vehicle over [start, end)."""
+    name, table, unit, _, _ = pick_resolution(start, end, max_points)
+    conn = database.get_read_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(
+        f"""SELECT bucket, samples, odometer_min, odometer_max,
+                   CASE WHEN fuel_level_count > 0 THEN fuel_level_sum / fuel_level_count END AS avg_fuel_level,
+                   last_latitude AS latitude, last_longitude AS longitude
+            FROM {table}
+            WHERE vehicle_id = %s AND bucket >= date_trunc(%s, %s::timestamp) AND bucket < %s
+            ORDER BY bucket
+            LIMIT %s""",
+        (vehicle_id, unit, start, end, max_points),
+    )
+    points = cursor.fetchall()
+    conn.close()
+    return {"resolution": name, "points": points}
+
+
+def prune(now: datetime = None):
+    """Delete raw readings and rollups past their retention. Returns rows deleted per table."""
+    now = now or datetime.utcnow()
+    deleted = {}
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM telemetry_readings WHERE recorded_at < %s", (now - RAW_RETENTION,))
+    deleted["telemetry_readings"] = cursor.rowcount
+    for _, table, _, _, retention in RESOLUTIONS:
+        if retention is None:
+            continue
+        cursor.execute(f"DELETE FROM {table} WHERE bucket < %s", (now - retention,))
+        deleted[table] = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
@@ -1,65 +1,70 @@
-<<<<<<< HEAD
-from fastapi import FastAPI, HTTPException
+import os
+import sys
+
+from fastapi import FastAPI, HTTPException, Request
 from passlib.context import CryptContext
-from sqlalchemy import or_
 
-from db import database, metadata, engine
+import storage
+from db import metadata, engine
 from schemas import UserCreate, UserLogin, ForgotPassword
-from models import users
 
 app = FastAPI()
 
 metadata.create_all(engine)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-@app.on_event("startup")
-async def startup():
-    await database.connect()
+# The login throttle is shared with the main app one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ratelimit  # noqa: E402
+
+# bcrypt is CPU-bound: more concurrent verifications than cores only adds
+# latency, so excess sign-ins are turned away with 429 instead of queueing
+VERIFY_CONCURRENCY = int(os.environ.get("AUTH_VERIFY_CONCURRENCY", os.cpu_count() or 1))
+signin_throttle = ratelimit.LoginThrottle("auth-signin", ratelimit.backend_from_env())
+verify_gate = ratelimit.AdmissionGate(VERIFY_CONCURRENCY)
 
-@app.on_event("shutdown")
-async def shutdown():
-    await database.disconnect()
+# Endpoints are plain `def` so FastAPI runs them in its threadpool: the pooled
+# SQLite engine and bcrypt are both blocking and must stay off the event loop.
 
 
 @app.post("/SignUp")
-async def user_signup(user: UserCreate):
+def user_signup(user: UserCreate):
     
     # Feature added: Expanded valid roles to include Safety and Financial analysts
     valid_roles = ["User", "Manager", "Dispatcher", "Safety Analyst", "Financial Analyst"]
     if user.role not in valid_roles:
         raise HTTPException(status_code=400, detail=f"Role must be one of: {', '.join(valid_roles)}.")
 
-    query = users.select().where(
-        or_(users.c.username == user.username, users.c.email == user.email)
-    )
-    user_exist = await database.fetch_one(query)
+    hashed_pass = pwd_context.hash(user.password)
 
-    if user_exist:
+    # Existence check and insert are one atomic statement
+    if not storage.create_user(user.username, user.email, hashed_pass, user.role):
         raise HTTPException(status_code=400, detail="User with this email or username already exists!")
     
-    hashed_pass = pwd_context.hash(user.password)
-    
-    insert_query = users.insert().values(
-        username=user.username, 
-        password=hashed_pass, 
-        email=user.email,
-        role=user.role
-    )
-    await database.execute(insert_query)
-    
     return {"message": f"Successfully registered as a {user.role}!"}
 
 
 @app.post("/SignIn")
-async def user_signin(user: UserLogin):
-    
-    query = users.select().where(users.c.email == user.email)
-    user_exist = await database.fetch_one(query)
+def user_signin(user: UserLogin, request: Request):
+
+    retry_after = signin_throttle.check(request.client.host if request.client else "", user.email)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many sign-in attempts. Please try again later.",
+                            headers=ratelimit.retry_after_header(retry_after))
+
+    user_exist = storage.get_user_by_email(user.email)
 
     if not user_exist:
         raise HTTPException(status_code=404, detail="Invalid Email or Password")
-    
-    if not pwd_context.verify(user.password, user_exist["password"]):
+
+    try:
+        with verify_gate:
+            verified = pwd_context.verify(user.password, user_exist["password"])
+    except ratelimit.Overloaded as exc:
+        raise HTTPException(status_code=429, detail="Sign-in is busy. Please try again shortly.",
+                            headers=ratelimit.retry_after_header(exc.retry_after))
+
+    if not verified:
         raise HTTPException(status_code=404, detail="Invalid Email or Password")
     
     user_role=user_exist["role"]
@@ -83,185 +88,23 @@ async def user_signin(user: UserLogin):
 
 
 @app.post("/ForgotPassword")
-async def forgot_password(data: ForgotPassword):
-    
-    query = users.select().where(users.c.email == data.email)
-    user_exist = await database.fetch_one(query)
-
-    if not user_exist:
-        raise HTTPException(status_code=404, detail="No account found with this email.")
-        
-    new_hashed_pass = pwd_context.hash(data.new_password)
-    
-    update_query = users.update().where(users.c.email == data.email).values(password=new_hashed_pass)
-    await database.execute(update_query)
-    
-    return {"message": "Password updated successfully!"}
-
-
-@app.get("/SecuredDashboard")
-async def secured_dashboard(email: str):
-    query = users.select().where(users.c.email == email)
-    user_data = await database.fetch_one(query)
-    
-    if not user_data:
-        raise HTTPException(status_code=404, detail="User not found")
-        
-    if user_data["role"] not in ["Manager", "Dispatcher"]:
-        raise HTTPException(status_code=403, detail="Access Denied: Requires Dispatcher or Manager privileges.")
-        
-    return {
-        "message": f"Access granted. Welcome to the secured dashboard, {user_data['role']}.",
-        "fleet_data": "..." 
-    }
-
-# ==========================================
-# NEW FEATURES: Safety & Financial Dashboards
-# ==========================================
-
-@app.get("/SafetyDashboard")
-async def safety_dashboard(email: str):
-    """
-    Purpose: Monitor driver compliance, license expirations, and safety scores.
-    Access: Manager, Safety Analyst
-    """
-    query = users.select().where(users.c.email == email)
-    user_data = await database.fetch_one(query)
-    
-    if not user_data:
-        raise HTTPException(status_code=404, detail="User not found")
-        
-    if user_data["role"] not in ["Manager", "Safety Analyst"]:
-        raise HTTPException(status_code=403, detail="Access Denied: Requires Safety Analyst privileges.")
-        
-    # Simulated compliance payload (This will later connect to your Python Driver class)
-    return {
-        "message": f"Welcome to the Safety & Compliance Portal, {user_data['role']}.",
-        # "data": {
-        #     "active_drivers": 12,
-        #     "expired_licenses_flagged": ["Driver-D2 (Sarah)"],
-        #     "average_fleet_safety_score": 94.2,
-        #     "compliance_status": "Warning: 1 License Expired"
-        # }
-    }
-
-
-@app.get("/FinancialDashboard")
-async def financial_dashboard(email: str):
-    """
-    Purpose: Audit fuel spend, maintenance ROI, and operational costs.
-    Access: Manager, Financial Analyst
-    """
-    query = users.select().where(users.c.email == email)
-    user_data = await database.fetch_one(query)
-    
-    if not user_data:
-        raise HTTPException(status_code=404, detail="User not found")
-        
-    if user_data["role"] not in ["Manager", "Financial Analyst"]:
-        raise HTTPException(status_code=403, detail="Access Denied: Requires Financial Analyst privileges.")
-        
-    # Simulated financial payload (This will later connect to your Python Vehicle class)
-    return {
-        "message": f"Welcome to the Financial Auditing Portal, {user_data['role']}.",
-        # "data": {
-        #     "total_fuel_spend": 3450.75,
-        #     "total_maintenance_costs": 1200.00,
-        #     "overall_operational_costs": 4650.75,
-        #     "fleet_average_roi": 0.18,
-        #     "flagged_assets": ["Van-05 (High Maintenance)"]
-        # }
-=======
-from fastapi import FastAPI, HTTPException
-from passlib.context import CryptContext
-from sqlalchemy import or_
-
-from db import database, metadata, engine
-from schemas import UserCreate, UserLogin, ForgotPassword
-from models import users
-
-app = FastAPI()
-
-metadata.create_all(engine)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-@app.on_event("startup")
-async def startup():
-    await database.connect()
-
-@app.on_event("shutdown")
-async def shutdown():
-    await database.disconnect()
-
-
-@app.post("/SignUp")
-async def user_signup(user: UserCreate):
-    
-    # Feature added: Expanded valid roles to include Safety and Financial analysts
-    valid_roles = ["User", "Manager", "Dispatcher", "Safety Analyst", "Financial Analyst"]
-    if user.role not in valid_roles:
-        raise HTTPException(status_code=400, detail=f"Role must be one of: {', '.join(valid_roles)}.")
-
-    query = users.select().where(
-        or_(users.c.username == user.username, users.c.email == user.email)
-    )
-    user_exist = await database.fetch_one(query)
-
-    if user_exist:
-        raise HTTPException(status_code=400, detail="User with this email or username already exists!")
-    
-    hashed_pass = pwd_context.hash(user.password)
-    
-    insert_query = users.insert().values(
-        username=user.username, 
-        password=hashed_pass, 
-        email=user.email,
-        role=user.role
-    )
-    await database.execute(insert_query)
-    
-    return {"message": f"Successfully registered as a {user.role}!"}
-
-
-@app.post("/SignIn")
-async def user_signin(user: UserLogin):
-    
-    query = users.select().where(users.c.email == user.email)
-    user_exist = await database.fetch_one(query)
-
-    if not user_exist:
-        raise HTTPException(status_code=404, detail="Invalid Email or Password")
-    
-    if not pwd_context.verify(user.password, user_exist["password"]):
-        raise HTTPException(status_code=404, detail="Invalid Email or Password")
-    
-    return {
-        "message": "User Successfully Logged In",
-        "role": user_exist["role"]
-    }
-
-
-@app.post("/ForgotPassword")
-async def forgot_password(data: ForgotPassword):
+def forgot_password(data: ForgotPassword):
     
-    query = users.select().where(users.c.email == data.email)
-    user_exist = await database.fetch_one(query)
+    user_exist = storage.get_user_by_email(data.email)
 
     if not user_exist:
         raise HTTPException(status_code=404, detail="No account found with this email.")
         
     new_hashed_pass = pwd_context.hash(data.new_password)
     
-    update_query = users.update().where(users.c.email == data.email).values(password=new_hashed_pass)
-    await database.execute(update_query)
+    storage.update_password(data.email, new_hashed_pass)
     
     return {"message": "Password updated successfully!"}
 
 
 @app.get("/SecuredDashboard")
-async def secured_dashboard(email: str):
-    query = users.select().where(users.c.email == email)
-    user_data = await database.fetch_one(query)
+def secured_dashboard(email: str):
+    user_data = storage.get_user_by_email(email)
     
     if not user_data:
         raise HTTPException(status_code=404, detail="User not found")
@@ -279,13 +122,12 @@ async def secured_dashboard(email: str):
 # ==========================================
 
 @app.get("/SafetyDashboard")
-async def safety_dashboard(email: str):
+def safety_dashboard(email: str):
     """
     Purpose: Monitor driver compliance, license expirations, and safety scores.
     Access: Manager, Safety Analyst
     """
-    query = users.select().where(users.c.email == email)
-    user_data = await database.fetch_one(query)
+    user_data = storage.get_user_by_email(email)
     
     if not user_data:
         raise HTTPException(status_code=404, detail="User not found")
@@ -306,13 +148,12 @@ async def safety_dashboard(email: str):
 
 
 @app.get("/FinancialDashboard")
-async def financial_dashboard(email: str):
+def financial_dashboard(email: str):
     """
     Purpose: Audit fuel spend, maintenance ROI, and operational costs.
     Access: Manager, Financial Analyst
     """
-    query = users.select().where(users.c.email == email)
-    user_data = await database.fetch_one(query)
+    user_data = storage.get_user_by_email(email)
     
     if not user_data:
         raise HTTPException(status_code=404, detail="User not found")
@@ -330,5 +171,4 @@ async def financial_dashboard(email: str):
         #     "fleet_average_roi": 0.18,
         #     "flagged_assets": ["Van-05 (High Maintenance)"]
         # }
->>>>>>> 77970be2dc6760e5e0d90184cfbb7c737b07cfae
     }
\ No newline at end of file
@@ -1,22 +1,38 @@
-<<<<<<< HEAD
-from databases import Database
-from sqlalchemy import create_engine, MetaData
+import os
 
-DATABASE_URL = "sqlite:///./users.db"
+from sqlalchemy import create_engine, event, MetaData
+from sqlalchemy.pool import QueuePool
 
-# Fixed: databases library
-database = Database(DATABASE_URL)
-# Fixed: MetaData capitalization
-metadata = MetaData()
-=======
-from databases import Database
-from sqlalchemy import create_engine, MetaData
+DATABASE_URL = os.environ.get("AUTH_DATABASE_URL", "sqlite:///./users.db")
 
-DATABASE_URL = "sqlite:///./users.db"
+# Connection pool for the sync SQLAlchemy engine the endpoints run on.
+# SQLite allows one writer at a time, so a modest pool is enough; extra
+# connections only add readers (which WAL lets run alongside the writer).
+POOL_SIZE = int(os.environ.get("AUTH_DB_POOL_SIZE", 8))
+MAX_OVERFLOW = int(os.environ.get("AUTH_DB_MAX_OVERFLOW", 8))
+# How long a writer waits for the lock before SQLite reports "database is locked"
+BUSY_TIMEOUT_MS = 10000
 
-# Fixed: databases library
-database = Database(DATABASE_URL)
 # Fixed: MetaData capitalization
 metadata = MetaData()
->>>>>>> 77970be2dc6760e5e0d90184cfbb7c737b07cfae
-engine = create_engine(DATABASE_URL)
\ No newline at end of file
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=QueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_MS / 1000},
+)
+
+
+@event.listens_for(engine, "connect")
+def _tune_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: readers never block the writer and vice versa
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # NORMAL is durable across app crashes in WAL mode; only an OS crash can lose the last commits
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA cache_size=-32000")  # 32 MB page cache per connection
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
@@ -1,45 +1,79 @@
-import asyncio
+import argparse
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
 from passlib.context import CryptContext
-from db import database, metadata, engine
-from models import users
+from sqlalchemy import text
+
+from db import metadata, engine
+import models  # noqa: F401  (registers the users table on metadata)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-async def seed_users():
+ROLES = ["User", "Manager", "Dispatcher", "Safety Analyst", "Financial Analyst"]
+
+# Define our test users
+TEST_USERS = [
+    {"username": "normal_user", "email": "user@test.com", "password": "password123", "role": "User"},
+    {"username": "dispatch_pro", "email": "dispatcher@test.com", "password": "password123", "role": "Dispatcher"},
+    {"username": "fleet_manager", "email": "manager@test.com", "password": "password123", "role": "Manager"},
+    {"username": "finance_guru", "email": "finance@test.com", "password": "password123", "role": "Financial Analyst"},
+    {"username": "safety_first", "email": "safety@test.com", "password": "password123", "role": "Safety Analyst"}
+]
+
+
+def synthetic_users(count: int, seed: int):
+    """Deterministic extra users for load testing."""
+    rng = random.Random(seed)
+    return [
+        {"username": f"scale_user_{i}", "email": f"scale_user_{i}@test.com",
+         "password": f"pw-{rng.getrandbits(48):012x}", "role": rng.choice(ROLES)}
+        for i in range(count)
+    ]
+
+
+def _hash(password: str):
+    return pwd_context.hash(password)
+
+
+def seed_users(extra: int = 0, seed: int = 42, workers: int = None):
     # Ensure the table exists
     metadata.create_all(engine)
-    await database.connect()
-
-    # Define our test users
-    test_users = [
-        {"username": "normal_user", "email": "user@test.com", "password": "password123", "role": "User"},
-        {"username": "dispatch_pro", "email": "dispatcher@test.com", "password": "password123", "role": "Dispatcher"},
-        {"username": "fleet_manager", "email": "manager@test.com", "password": "password123", "role": "Manager"},
-        {"username": "finance_guru", "email": "finance@test.com", "password": "password123", "role": "Financial Analyst"},
-        {"username": "safety_first", "email": "safety@test.com", "password": "password123", "role": "Safety Analyst"}
-    ]
+    candidates = TEST_USERS + synthetic_users(extra, seed)
 
-    print("Seeding database...")
-    for u in test_users:
-        # Check if user already exists to prevent duplicate errors
-        query = users.select().where(users.c.email == u["email"])
-        exists = await database.fetch_one(query)
-        
-        if not exists:
-            hashed_pass = pwd_context.hash(u["password"])
-            insert_query = users.insert().values(
-                username=u["username"], 
-                email=u["email"], 
-                password=hashed_pass, 
-                role=u["role"]
+    with engine.connect() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT email FROM users"))}
+    pending = [u for u in candidates if u["email"] not in existing]
+    for u in candidates:
+        if u["email"] in existing:
+            print(f"Skipped: {u['email']} already exists.")
+
+    print(f"Seeding database: hashing {len(pending)} passwords...")
+    # bcrypt is CPU-bound and deliberately slow; spread it across cores
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        hashes = list(pool.map(_hash, [u["password"] for u in pending], chunksize=16))
+
+    rows = [{"username": u["username"], "email": u["email"], "password": h, "role": u["role"]}
+            for u, h in zip(pending, hashes)]
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO users (username, email, password, role) "
+                     "VALUES (:username, :email, :password, :role) ON CONFLICT DO NOTHING"),
+                rows,
             )
-            await database.execute(insert_query)
+    test_emails = {u["email"] for u in TEST_USERS}
+    for u in pending:
+        if u["email"] in test_emails:
             print(f"Created: {u['role']} ({u['email']})")
-        else:
-            print(f"Skipped: {u['email']} already exists.")
+    print(f"Database seeding complete! {len(rows)} users inserted.")
 
-    await database.disconnect()
-    print("Database seeding complete!")
 
 if __name__ == "__main__":
-    asyncio.run(seed_users())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Seed the auth service user table.")
+    parser.add_argument("--users", type=int, default=0, help="extra synthetic users to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: all cores)")
+    args = parser.parse_args()
+    seed_users(args.users, args.seed, args.workers)
@@ -0,0 +1,52 @@
+"""
+User storage for the auth service.
+
+All queries run on the pooled, WAL-tuned engine from db.py. The helpers are
+synchronous; endpoints that use them are plain ``def`` so FastAPI runs them
+(and the bcrypt work next to them) in its threadpool instead of on the event
+loop.
+"""
+from sqlalchemy import text
+
+from db import engine
+from models import users
+
+# One statement: SQLite takes the write lock before evaluating the NOT EXISTS,
+# so two concurrent sign-ups for the same username/email cannot both insert.
+# ON CONFLICT covers the UNIQUE(email) constraint as a second line of defence.
+_SIGNUP_SQL = text("""
+    INSERT INTO users (username, email, password, role)
+    SELECT :username, :email, :password, :role
+    WHERE NOT EXISTS (
+        SELECT 1 FROM users WHERE username = :username OR email = :email
+    )
+    ON CONFLICT DO NOTHING
+""")
+
+
+def get_user_by_email(email: str):
+    """Return the user row mapping for an email, or None."""
+    with engine.connect() as conn:
+        row = conn.execute(users.select().where(users.c.email == email)).first()
+    return row._mapping if row else None
+
+
+def create_user(username: str, email: str, password_hash: str, role: str):
+    """Insert a user unless the username or email is taken. Returns True if inserted."""
+    with engine.begin() as conn:
+        result = conn.execute(_SIGNUP_SQL, {
+            "username": username,
+            "email": email,
+            "password": password_hash,
+            "role": role,
+        })
+    return result.rowcount == 1
+
+
+def update_password(email: str, password_hash: str):
+    """Replace a user's password hash. Returns True if the user exists."""
+    with engine.begin() as conn:
+        result = conn.execute(
+            users.update().where(users.c.email == email).values(password=password_hash)
+        )
+    return result.rowcount == 1